@@ -1,72 +1,63 @@
 from lib_3d import factory_3d, utils_3d
 import os
 import terminal_drawing
+import tiled_drawing
+import frame_pacing
+import headless
+import profiling
 import time
 import sys, signal
-import keyboard
 import config
 
+keyboard = None # Imported in start(), only when user control is enabled
+# Set in start(), the SIGINT handler is installed before they are
+active_mesh = None
+frame_writer = None
+renderer = None
+profiler = None
 
-cube = factory_3d.cube_factory(3)
-toroid = factory_3d.toroid_factory(2, 1, resolution=20)
-toroid_high_poly = factory_3d.toroid_factory(2, 1, resolution=50)
-pyramid = factory_3d.pyramid_factory(4, 3)
-shuttle = factory_3d.import_mesh("3d_models/shuttle.obj")
-flower = factory_3d.import_mesh("3d_models/flower.obj")
-
-
-AVAILABLE_MODELS = {
-    config.AvailableMeshes.CUBE: cube,
-    config.AvailableMeshes.TOROID: toroid,
-    config.AvailableMeshes.TOROID_HIGH_POLY: toroid_high_poly,
-    config.AvailableMeshes.PYRAMID: pyramid,
-    config.AvailableMeshes.SHUTTLE: shuttle,
-    config.AvailableMeshes.FLOWER: flower,
-
-}
 
 def draw(mesh, cam, fps=None):
-    global screen, last_frame_dirty_pixels
-    faces = mesh.depth_sort_faces(cam)
-    affected_coords = []
-    for face in faces:
-        if face:
-            dirty_pixels = terminal_drawing.draw_face_on_screen(face, cam, screen, ASCII_LIST)
-            if config.ENABLE_DIRTY_RECTANGLES:
-                affected_coords += dirty_pixels
-    
+    terminal_drawing.render_mesh(mesh, cam, screen, ASCII_LIST, renderer)
+
     if fps is not None and config.ENABLE_FPS_COUNTER:
         terminal_drawing.draw_fps(fps, screen)
 
 
 
-    terminal_drawing.draw_screen(screen)
-    last_frame_dirty_pixels = affected_coords
+    if profiler is not None and config.PROFILING_SETTINGS.get('OVERLAY', True):
+        profiling.draw_overlay(profiler, screen)
 
-    screen = terminal_drawing.get_screen_matrix()
+    if frame_writer is not None:
+        frame_writer.submit(screen)
+    else:
+        terminal_drawing.draw_screen(screen, screen.last_frame if config.ENABLE_DIRTY_RECTANGLES else None)
+        screen.swap()
+    screen.clear()
 
 def start():
-    global TARGET_FPS, ASCII_LIST, cam, light_source, light_intensity, active_mesh, rx, ry, rz, real_fps, frame_count, execution_start, last_time, screen
+    global keyboard, scheduler, ASCII_LIST, cam, light_sources, active_mesh, rx, ry, rz, real_fps, frame_count, drawn_mesh, execution_start, screen, renderer, frame_writer, profiler
+
+    if config.ENABLE_USER_CONTROL:
+        import keyboard
 
     #-- terminal configs --#
-    ASCII_LIST = terminal_drawing.generate_ascii_list()
+    ASCII_LIST = terminal_drawing.generate_ascii_list(
+        config.ASCII_RAMP_SETTINGS.get('FONT_PATH'),
+        config.ASCII_RAMP_SETTINGS.get('FONT_SIZE', terminal_drawing.DEFAULT_FONT_SIZE)
+    )
     terminal_drawing.hide_cursor()
     signal.signal(signal.SIGINT, sgint_handler)
 
     #-- camera --#
-    cam = utils_3d.Camera(
-        utils_3d.Vertex(
-            *config.CAMERA_SETTINGS.get('POSITION', (0,0,-5))
-            )
-        )
-    utils_3d.setup_camera(cam)
+    cam = utils_3d.create_camera()
 
     #-- light source --#
-    light_source = utils_3d.Vertex(*config.LIGHT_SOURCE.get('POSITION', (0,0,-5)))
-    light_intensity = config.LIGHT_SOURCE.get('INTENSITY', 1)
+    light_sources = utils_3d.create_light_sources()
 
     #-- mesh data --#
-    active_mesh = AVAILABLE_MODELS[config.ACTIVE_MODEL]
+    active_mesh = factory_3d.get_model(config.ACTIVE_MODEL)
+    drawn_mesh = None
     rx = 0
     ry = 0
     rz = 0
@@ -75,22 +66,52 @@ def start():
     real_fps = 0
     frame_count = 0
     execution_start = time.time()
-    last_time = None
-    screen = terminal_drawing.get_screen_matrix()
+    scheduler = frame_pacing.FrameScheduler(config.TARGET_FPS, config.ENABLE_ADAPTIVE_QUALITY)
+    screen = terminal_drawing.ScreenBuffer()
+    screen.watch_terminal_resize()
+
+    #-- profiling --#
+    profiler = None
+    if config.ENABLE_PROFILING:
+        profiler = profiling.Profiler(config.PROFILING_SETTINGS.get('FRAMES', 600))
+        profiling.install(profiler)
+
+    #-- terminal output --#
+    frame_writer = None
+    if config.ENABLE_PIPELINED_OUTPUT:
+        frame_writer = terminal_drawing.FrameWriter(config.PIPELINE_MAX_PENDING_FRAMES, config.ENABLE_DIRTY_RECTANGLES)
+
+    #-- parallel rasterization --#
+    renderer = None
+    if config.RENDER_WORKERS > 0:
+        renderer = tiled_drawing.TiledRenderer(config.RENDER_WORKERS)
 
 
 def update():
+    global drawn_mesh
     update_rotation_values()
     active_mesh.rotate_to(x=rx, y=ry, z=rz)
-    active_mesh.apply_light_source(light_source, light_intensity)
+    mesh = active_mesh
+    if config.ENABLE_LOD:
+        mesh = active_mesh.select_lod(cam, screen.height, screen.width, bias=scheduler.quality_level)
+    # A level of detail that wasn't drawn in the last frame has outdated light values
+    if mesh is not drawn_mesh or scheduler.lighting_update_due():
+        mesh.apply_light_sources(light_sources)
+    drawn_mesh = mesh
 
-    draw(active_mesh, cam, real_fps)
+    draw(mesh, cam, real_fps)
 
     
 
 def sgint_handler(signal, frame):
+    if frame_writer is not None:
+        frame_writer.close()
     terminal_drawing.show_cursor()
-    if config.ENABLE_SAVE_LOGS:
+    if renderer is not None:
+        renderer.close()
+    if profiler is not None and config.PROFILING_SETTINGS.get('EXPORT_PATH'):
+        profiler.export(config.PROFILING_SETTINGS['EXPORT_PATH'])
+    if config.ENABLE_SAVE_LOGS and active_mesh is not None:
         faces = len(active_mesh.faces)
         name = active_mesh.name
         fps = "{:.2f}".format(frame_count / (time.time() - execution_start))
@@ -144,17 +165,17 @@ def update_rotation_values():
         cam.look_at_target(active_mesh.center)
 
 
-start()
-while True:
-    current_time = time.time()
-    if last_time is None:
-        delta_time = 0
-    else:
-        delta_time = current_time - last_time
-    
-    if delta_time > 0:
-        real_fps = 1/delta_time
-    last_time = current_time
-
-    update()
-    frame_count+=1
\ No newline at end of file
+if __name__ == '__main__' and config.ENABLE_HEADLESS:
+    headless.run()
+elif __name__ == '__main__': # The rasterization workers may import this module
+    start()
+    while True:
+        delta_time = scheduler.wait_next_frame()
+        if delta_time > 0:
+            real_fps = 1/delta_time
+
+        update()
+        scheduler.frame_done()
+        if profiler is not None:
+            profiler.end_frame()
+        frame_count+=1
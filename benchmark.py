@@ -0,0 +1,195 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import config
+import profiling
+import terminal_drawing
+import tiled_drawing
+from lib_3d import factory_3d, utils_3d
+
+DEFAULT_RESOLUTIONS = ((80, 24), (160, 48), (320, 96))
+DEFAULT_FRAMES = 120
+WARMUP_FRAMES = 5
+SCRIPT_FPS = 30 # Time step of the rotation script, the benchmark itself runs as fast as possible
+
+
+def rotation_script(frames:int):
+    """
+    Rotation (x, y, z) of every frame: the mesh spins like with user control disabled, at a fixed time step
+    """
+    for frame in range(frames):
+        rotation = config.ROTATION_SPPEED * frame / SCRIPT_FPS
+        yield rotation, rotation, rotation
+
+
+def render_frame(mesh:utils_3d.Mesh, cam:utils_3d.Camera, screen:terminal_drawing.ScreenBuffer, ascii_list, light_sources, rotation, renderer=None) -> utils_3d.Mesh:
+    """
+    Renders one frame with the same calls as the interactive loop and writes it to sys.stdout. Returns the mesh drawn (the level of detail, with config.ENABLE_LOD)
+    """
+    mesh.rotate_to(*rotation)
+    if config.ENABLE_LOD:
+        mesh = mesh.select_lod(cam, screen.height, screen.width)
+    mesh.apply_light_sources(light_sources)
+    terminal_drawing.render_mesh(mesh, cam, screen, ascii_list, renderer)
+    terminal_drawing.draw_screen(screen, screen.last_frame if config.ENABLE_DIRTY_RECTANGLES else None)
+    screen.swap()
+    screen.clear()
+    return mesh
+
+
+def play(model_mesh:utils_3d.Mesh, width:int, height:int, frames:int, renderer=None):
+    """
+    Renders the rotation script on a new instance of the mesh and a new screen, so every pass (and every case)
+    starts from the rest pose and a blank terminal whatever ran before. Yields the mesh drawn in each frame
+    """
+    mesh = model_mesh.instance()
+    ascii_list = terminal_drawing.generate_ascii_list()
+    cam = utils_3d.create_camera()
+    light_sources = utils_3d.create_light_sources()
+    screen = terminal_drawing.ScreenBuffer(width, height)
+    for rotation in rotation_script(frames):
+        yield render_frame(mesh, cam, screen, ascii_list, light_sources, rotation, renderer)
+
+
+def run_case(model:config.AvailableMeshes, width:int, height:int, frames:int, renderer=None) -> dict:
+    mesh = factory_3d.get_model(model)
+    with open(os.devnull, 'w') as output, contextlib.redirect_stdout(output):
+        for _ in play(mesh, width, height, WARMUP_FRAMES, renderer):
+            pass
+
+        # The frame times are measured without the profiling hooks, they have a cost of their own
+        frame_times = []
+        drawn_faces = []
+        frame_start = time.perf_counter()
+        for drawn_mesh in play(mesh, width, height, frames, renderer):
+            frame_end = time.perf_counter()
+            frame_times.append(frame_end - frame_start)
+            drawn_faces.append(len(drawn_mesh.index_buffer))
+            frame_start = time.perf_counter()
+
+        # The stages and counters in a separate pass with the hooks
+        profiler = profiling.Profiler(frames)
+        profiling.install(profiler)
+        try:
+            for _ in play(mesh, width, height, frames, renderer):
+                profiler.end_frame()
+        finally:
+            profiling.uninstall()
+
+    # Memory in a separate pass, tracing allocations slows everything down
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in play(mesh, width, height, WARMUP_FRAMES, renderer):
+            pass
+    peak_traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    frame_times = np.array(frame_times) * 1000
+    averages = profiler.averages(frames)
+    return {
+        'model': model.name,
+        'faces': len(mesh.index_buffer),
+        'vertices': len(mesh.rest_vertices),
+        'drawn_faces': float(np.mean(drawn_faces)), # Faces of the level of detail drawn, with config.ENABLE_LOD
+        'width': width,
+        'height': height,
+        'frames': frames,
+        'frame_ms': {
+            'mean': float(frame_times.mean()),
+            'p50': float(np.percentile(frame_times, 50)),
+            'p95': float(np.percentile(frame_times, 95)),
+            'p99': float(np.percentile(frame_times, 99)),
+        },
+        'fps': float(1000 / frame_times.mean()),
+        'stage_ms': {stage: averages[stage] for stage in profiling.STAGES},
+        'counters': {counter: averages[counter] for counter in profiling.COUNTERS},
+        'peak_traced_kb': peak_traced // 1024,
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'config': {
+            name: getattr(config, name) for name in dir(config)
+            if name.startswith('ENABLE_') and isinstance(getattr(config, name), bool) or name == 'RENDER_WORKERS'
+        },
+    }
+
+
+def compare(report:dict, baseline:dict):
+    """
+    Prints the change of every case also present in the baseline report
+    """
+    baseline_results = {(result['model'], result['width'], result['height']): result for result in baseline['results']}
+    print(f"Compared to {baseline.get('commit')}:", file=sys.stderr)
+    for result in report['results']:
+        base = baseline_results.get((result['model'], result['width'], result['height']))
+        if base is None:
+            continue
+        changes = ", ".join(
+            f"{key} {base['frame_ms'][key]:.2f} -> {result['frame_ms'][key]:.2f} ms ({result['frame_ms'][key] / base['frame_ms'][key] - 1:+.0%})"
+            for key in ('p50', 'p99')
+        )
+        print(f"{result['model']} {result['width']}x{result['height']}: {changes}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders a fixed rotation script for every model and resolution, without a terminal, and reports the timings as JSON")
+    parser.add_argument('--frames', type=int, default=DEFAULT_FRAMES)
+    parser.add_argument('--models', nargs='*', default=[model.name for model in config.AvailableMeshes], choices=[model.name for model in config.AvailableMeshes])
+    parser.add_argument('--resolutions', nargs='*', default=[f"{w}x{h}" for w, h in DEFAULT_RESOLUTIONS], help="WIDTHxHEIGHT")
+    parser.add_argument('--output', help="JSON file, stdout by default")
+    parser.add_argument('--compare', help="JSON file of a previous run to compare with")
+    args = parser.parse_args()
+
+    renderer = tiled_drawing.TiledRenderer(config.RENDER_WORKERS) if config.RENDER_WORKERS > 0 else None
+    results = []
+    try:
+        for model_name in args.models:
+            for resolution in args.resolutions:
+                width, height = (int(value) for value in resolution.lower().split('x'))
+                results.append(run_case(config.AvailableMeshes[model_name], width, height, args.frames, renderer))
+                print(
+                    "{model} {width}x{height}: {fps:.1f} fps, p99 {p99:.2f} ms".format(p99=results[-1]['frame_ms']['p99'], **results[-1]),
+                    file=sys.stderr
+                )
+    finally:
+        if renderer is not None:
+            renderer.close()
+
+    report = environment()
+    report['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # kB on Linux
+    report['results'] = results
+    if args.compare:
+        with open(args.compare) as file:
+            compare(report, json.load(file))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,68 @@
 from enum import Enum, auto as a
+import os
 # Use this file to change the scenarios. Better than changing it in __main__.py
 
 # Fps counter on the right-bottom side of the render
 ENABLE_FPS_COUNTER = True
 
-# Mark a pixel as dirty when it changes, so only the changed pixels need to be updated. Uses more memory. (TODO: Revisit Implementation)
-ENABLE_DIRTY_RECTANGLES = False 
+# Compare each frame with the previous one and only write the cells that changed (using cursor positioning escapes). Uses more memory.
+ENABLE_DIRTY_RECTANGLES = True
+
+# Write the frames to the terminal from a separate thread while the next frame is computed. When the terminal can't
+# keep up, the oldest of the pending frames is dropped
+ENABLE_PIPELINED_OUTPUT = False
+PIPELINE_MAX_PENDING_FRAMES = 2
 
 # Only project visible faces, ignore faces that are facing away from the camera (TODO: Change the normal face calculation)
 ENABLE_BACKFACE_CULLING = True
 
+# Skip faces that are off screen or behind the camera, and whole meshes whose bounding sphere is outside the view
+ENABLE_FRUSTUM_CULLING = True
+
+# Number of worker processes rasterizing bands of the screen in parallel (tiled_drawing), 0 renders in the main process
+RENDER_WORKERS = 0
+
+# Fill faces with the scanline rasterizer (row slices) instead of testing each pixel of the bounding box with is_point_in_triangle
+ENABLE_VECTORIZED_RASTERIZER = True
+
+# Use a per cell depth buffer (z-buffer) to hide occluded faces instead of sorting the faces by distance every frame (painter's algorithm)
+ENABLE_DEPTH_BUFFER = False
+
+# Compute the light of each vertex and interpolate it inside the faces (Gouraud shading) instead of one light value per face. Smooth shading without high poly meshes
+ENABLE_GOURAUD_SHADING = False
+
+# Draw a coarser version of the mesh when it covers few screen cells: the finest level with at most LOD_FACES_PER_CELL
+# faces per cell covered by the mesh. The toroids are regenerated at lower resolutions, imported meshes are decimated
+ENABLE_LOD = True
+LOD_FACES_PER_CELL = 1
+
+# Render without a terminal: FRAMES frames of WIDTH x HEIGHT are written as plain text (no escape sequences) to OUTPUT
+# (a file path, or None for stdout), each one followed by FRAME_SEPARATOR. The mesh spins with a fixed time step of 1/FPS
+ENABLE_HEADLESS = False
+HEADLESS_SETTINGS = {
+    'WIDTH': 120,
+    'HEIGHT': 40,
+    'FRAMES': 120,
+    'FPS': 30,
+    'OUTPUT': None,
+    'FRAME_SEPARATOR': "\f\n",
+}
+
+# Cap the frame rate, the time left in each frame is slept instead of spinning at 100% CPU. 0 renders as fast as possible
+TARGET_FPS = 30
+
+# Lower the quality while the frames take longer than the TARGET_FPS budget (the lighting is updated less often)
+ENABLE_ADAPTIVE_QUALITY = False
+
+# Record the time of every stage (rotate, light, sort, draw, output) and counters (faces culled, cells filled, bytes
+# written) of the last FRAMES frames. OVERLAY shows their rolling averages on screen, EXPORT_PATH is a CSV file written on exit
+ENABLE_PROFILING = False
+PROFILING_SETTINGS = {
+    'FRAMES': 600,
+    'OVERLAY': True,
+    'EXPORT_PATH': None,
+}
+
 # Enables object rotation and camera movement 
 ENABLE_USER_CONTROL = True
 
@@ -20,6 +73,22 @@ ENABLE_SAVE_LOGS = False # Performance logs
 
 
 
+# Font used to sort the characters by brightness. None uses the built-in ramp of the default font (Pillow is not needed)
+ASCII_RAMP_SETTINGS = {
+    'FONT_PATH': None,
+    'FONT_SIZE': 16,
+}
+
+# Where computed data (like the ascii ramps of other fonts) is cached between runs
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+# Store imported .obj models as compiled binary meshes in CACHE_DIR (rebuilt when the .obj file changes)
+ENABLE_MESH_CACHE = True
+
+# Merge .obj vertices closer than this distance (duplicated positions on uv/normal seams). None disables it
+OBJ_WELD_EPSILON = 1e-6
+
+
 CAMERA_SETTINGS = {
     # This is important for the camera because the pixels (in this context, chars) are not really squared, instead the height is usually 2x the width size
     'CHAR_HEIGHT/WIDTH_PROPORTION': 2,
@@ -30,10 +99,13 @@ CAMERA_SETTINGS = {
 }
 
 LIGHT_SOURCE = {
-    'POSITION': (0, 10, 20),
+    'POSITION': (0, 10, -20),
     'INTENSITY': 1
 }
 
+# More light sources, same format as LIGHT_SOURCE. The light of every source is added up
+EXTRA_LIGHT_SOURCES = []
+
 
 class AvailableMeshes(Enum):
     CUBE = a()
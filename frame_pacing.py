@@ -0,0 +1,72 @@
+import time
+
+SPIN_TIME = 0.001 # time.sleep can overshoot by around a millisecond, the end of the wait is a busy loop
+MAX_QUALITY_LEVEL = 3
+DEGRADE_RATIO = 1.0 # Average frame work above this fraction of the budget lowers the quality
+RESTORE_RATIO = 0.6 # Average frame work below this fraction of the budget raises it again
+AVERAGE_WEIGHT = 0.1 # Weight of the last frame in the moving average of the frame work
+
+
+class FrameScheduler:
+    """
+    Caps the frame rate to target_fps: frames start on a fixed schedule and the time left in the frame budget is
+    slept instead of spinning. A frame that starts late moves the schedule, there is no burst of frames to catch up.
+    With adaptive quality, quality_level goes up (worse quality) while the frames take longer than the budget and back
+    down when there is room again. Level 0 is full quality; at level n the lighting is only updated every n+1 frames
+    and, with config.ENABLE_LOD, the mesh is drawn n levels of detail coarser
+    """
+
+    def __init__(self, target_fps:float=0, adaptive_quality:bool=False) -> None:
+        self.frame_budget = 1 / target_fps if target_fps > 0 else 0
+        self.adaptive_quality = adaptive_quality and self.frame_budget > 0
+        self.quality_level = 0
+        self.average_work_time = 0
+        self._frame_count = 0
+        self._next_frame_time:float = None
+        self._frame_start:float = None
+
+    def wait_next_frame(self) -> float:
+        """
+        Sleeps until the next frame is due and returns the time since the previous frame started (0 for the first one)
+        """
+        now = time.perf_counter()
+        if self._next_frame_time is not None and self.frame_budget > 0:
+            if now < self._next_frame_time:
+                self._sleep_until(self._next_frame_time)
+                now = time.perf_counter()
+        # Keep the schedule, unless the frame is late by more than a whole budget
+        if self._next_frame_time is None or now - self._next_frame_time > self.frame_budget:
+            self._next_frame_time = now
+        self._next_frame_time += self.frame_budget
+
+        delta_time = 0 if self._frame_start is None else now - self._frame_start
+        self._frame_start = now
+        self._frame_count += 1
+        return delta_time
+
+    def frame_done(self):
+        """
+        Called when the frame work is done, the time since wait_next_frame returned drives the adaptive quality
+        """
+        work_time = time.perf_counter() - self._frame_start
+        self.average_work_time += (work_time - self.average_work_time) * AVERAGE_WEIGHT
+        if not self.adaptive_quality:
+            return
+        if self.average_work_time > self.frame_budget * DEGRADE_RATIO and self.quality_level < MAX_QUALITY_LEVEL:
+            self.quality_level += 1
+            self.average_work_time = self.frame_budget * (DEGRADE_RATIO + RESTORE_RATIO) / 2 # Wait for new samples before changing again
+        elif self.average_work_time < self.frame_budget * RESTORE_RATIO and self.quality_level > 0:
+            self.quality_level -= 1
+            self.average_work_time = self.frame_budget * (DEGRADE_RATIO + RESTORE_RATIO) / 2
+
+    def lighting_update_due(self) -> bool:
+        return self._frame_count % (self.quality_level + 1) == 0
+
+    @staticmethod
+    def _sleep_until(deadline:float):
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            if remaining > SPIN_TIME:
+                time.sleep(remaining - SPIN_TIME)
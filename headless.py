@@ -0,0 +1,82 @@
+import os
+import sys
+import numpy as np
+import config
+import terminal_drawing
+from lib_3d import factory_3d, utils_3d
+
+
+def render_frames(width:int, height:int, frames:int, mesh:utils_3d.Mesh=None, fps:float=None, renderer=None):
+    """
+    Renders the mesh spinning as it does with user control disabled (ROTATION_SPPEED on every axis), with a fixed
+    time step of 1/fps so the frames are always the same, into an in memory screen of the given size.
+    Yields the (height, width) uint8 array of ASCII codes of each frame. The array is reused, copy it to keep it
+    """
+    if mesh is None:
+        mesh = factory_3d.get_model(config.ACTIVE_MODEL)
+    mesh = mesh.instance() # Rotations accumulate, start from the rest pose whatever was done with the mesh before
+    fps = fps or config.TARGET_FPS or 30
+    ascii_list = terminal_drawing.generate_ascii_list(
+        config.ASCII_RAMP_SETTINGS.get('FONT_PATH'),
+        config.ASCII_RAMP_SETTINGS.get('FONT_SIZE', terminal_drawing.DEFAULT_FONT_SIZE)
+    )
+    cam = utils_3d.create_camera()
+    light_sources = utils_3d.create_light_sources()
+    screen = terminal_drawing.ScreenBuffer(width, height)
+
+    for frame in range(frames):
+        rotation = config.ROTATION_SPPEED * frame / fps
+        mesh.rotate_to(x=rotation, y=rotation, z=rotation)
+        drawn_mesh = mesh.select_lod(cam, height, width) if config.ENABLE_LOD else mesh
+        drawn_mesh.apply_light_sources(light_sources)
+        screen.clear()
+        terminal_drawing.render_mesh(drawn_mesh, cam, screen, ascii_list, renderer)
+        yield screen.data
+
+
+def frame_text(frame:np.ndarray) -> str:
+    """
+    Plain text of a frame, one line per row
+    """
+    lines = np.empty((frame.shape[0], frame.shape[1] + 1), dtype=np.uint8)
+    lines[:, :-1] = frame
+    lines[:, -1] = ord('\n')
+    return lines.tobytes().decode('ascii')
+
+
+def stream_frames(output, frames, separator:str="\f\n"):
+    """
+    Writes the frames (e.g. from render_frames) to a text stream, each one followed by the separator
+    """
+    for frame in frames:
+        output.write(frame_text(frame))
+        output.write(separator)
+        output.flush()
+
+
+def run():
+    """
+    Renders the frames described in config.HEADLESS_SETTINGS, no terminal needed
+    """
+    settings = config.HEADLESS_SETTINGS
+    renderer = None
+    if config.RENDER_WORKERS > 0:
+        import tiled_drawing
+        renderer = tiled_drawing.TiledRenderer(config.RENDER_WORKERS)
+
+    output_path = settings.get('OUTPUT')
+    output = open(output_path, 'w') if output_path else sys.stdout
+    try:
+        frames = render_frames(settings.get('WIDTH', 120), settings.get('HEIGHT', 40), settings.get('FRAMES', 120), fps=settings.get('FPS'), renderer=renderer)
+        stream_frames(output, frames, settings.get('FRAME_SEPARATOR', "\f\n"))
+    except BrokenPipeError:
+        # The reader closed the pipe early (e.g. `python . | head`), stop rendering. The data still buffered can't
+        # be written anymore, it goes to devnull so closing the stream doesn't raise again
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, output.fileno())
+        os.close(devnull)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if renderer is not None:
+            renderer.close()
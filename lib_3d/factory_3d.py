@@ -1,7 +1,12 @@
 
-from lib_3d import utils_3d
-import trimesh
+from lib_3d import utils_3d, mesh_cache
 import math
+import os
+import numpy as np
+import config
+
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '3d_models')
 
 
 def _toroid_quads_factory(vertices: list[utils_3d.Face], resolution: int, r:int) -> list[utils_3d.Face]:
@@ -121,33 +126,132 @@ def pyramid_factory(base_size:float, height:float) -> utils_3d.Mesh:
     return mesh
 
 
-def import_mesh(path):
-    # Load the .obj file
-    mesh = trimesh.load(path, force="mesh")
-    vertices = []
-    faces = []
+def load_obj(path) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Streams a .obj file into a (N, 3) vertex buffer and a (F, 3) index buffer.
+    Only `v` and `f` statements are read. Faces can use the `v`, `v/vt`, `v//vn` and `v/vt/vn` syntax and
+    negative (relative) indices; quads and n-gons are fan triangulated.
+    """
+    coordinates = []
+    indices = []
+    vertex_count = 0
+    with open(path) as file:
+        for line in file:
+            if line.startswith('v '):
+                coordinates += line.split()[1:4]
+                vertex_count += 1
+            elif line.startswith('f '):
+                face = []
+                for token in line.split()[1:]:
+                    idx = int(token.partition('/')[0])
+                    face.append(idx - 1 if idx > 0 else vertex_count + idx)
+                for i in range(1, len(face) - 1):
+                    indices += (face[0], face[i], face[i + 1])
 
-    exit()
-    for vertex in mesh.vertices:
-        vertices.append(
-            utils_3d.Vertex(
-                vertex[0],
-                vertex[1],
-                vertex[2],
-            )
-        )
-    
-    for face in mesh.faces:
-        v1 = vertices[face[0]]
-        v2 = vertices[face[1]]
-        v3 = vertices[face[2]]
-        faces.append(
-            utils_3d.Face(
-                v1, v2, v3
-            )
-        )
-    
-    mesh = utils_3d.Mesh(faces)
+    vertices = np.array(coordinates, dtype=float).reshape(-1, 3)
+    index_buffer = np.array(indices, dtype=np.intp).reshape(-1, 3)
+    return vertices, index_buffer
+
+
+def import_mesh(path, weld_epsilon:float=None) -> utils_3d.Mesh:
+    """
+    Imports a .obj file, with its decimated levels of detail if config.ENABLE_LOD. With config.ENABLE_MESH_CACHE the
+    compiled mesh and its levels of detail are stored in config.CACHE_DIR, keyed by the hash of the .obj file, and
+    loaded memory mapped on the next runs.
+    weld_epsilon merges duplicated vertex positions (.obj exporters often split vertices on uv/normal seams)
+    """
+    if weld_epsilon is None:
+        weld_epsilon = config.OBJ_WELD_EPSILON
+    if not config.ENABLE_MESH_CACHE:
+        return _build_imported_mesh(path, weld_epsilon, lods=config.ENABLE_LOD)
+
+    source_hash = mesh_cache.file_hash(path)
+    cache_dir = os.path.join(config.CACHE_DIR, 'meshes')
+    compiled_path = mesh_cache.cache_path(cache_dir, path, source_hash, weld_epsilon)
+    mesh = None
+    if os.path.exists(compiled_path):
+        try:
+            mesh = mesh_cache.load_compiled_mesh(compiled_path)
+        except (OSError, ValueError, KeyError):
+            pass # Corrupted cache, build it again
+
+    if mesh is None:
+        mesh = _build_imported_mesh(path, weld_epsilon, lods=True) # Cached whatever config.ENABLE_LOD is
+        try:
+            mesh_cache.save_compiled_mesh(compiled_path, mesh, source_hash)
+            mesh_cache.remove_stale_caches(cache_dir, path, compiled_path, weld_epsilon)
+        except OSError:
+            pass # Caching is only an optimization
+    if not config.ENABLE_LOD:
+        mesh.set_lods([])
+    return mesh
+
+
+def _build_imported_mesh(path, weld_epsilon:float=None, lods:bool=False) -> utils_3d.Mesh:
+    vertices, index_buffer = load_obj(path)
+    mesh = utils_3d.Mesh.from_buffers(vertices, index_buffer, weld_epsilon=weld_epsilon)
     mesh.name = path
+    if lods:
+        with_lods(mesh, decimated_lods(mesh))
+    return mesh
+
+
+def parametric_lods(factory, resolution:int, min_resolution:int=8) -> list[utils_3d.Mesh]:
+    """
+    Levels of detail of a parametric mesh, regenerated with factory(resolution) halving the resolution each level
+    """
+    lods = []
+    resolution //= 2
+    while resolution >= min_resolution:
+        lods.append(factory(resolution))
+        resolution //= 2
+    return lods
+
+
+def decimated_lods(mesh:utils_3d.Mesh, levels:int=2, ratio:float=0.25) -> list[utils_3d.Mesh]:
+    """
+    Levels of detail of a triangle mesh (e.g. imported), each one with `ratio` of the faces of the previous one
+    """
+    lods = []
+    vertices, index_buffer = mesh.rest_vertices, mesh.index_buffer
+    for _ in range(levels):
+        vertices, index_buffer = utils_3d.collapse_edges(vertices, index_buffer, int(len(index_buffer) * ratio))
+        if len(index_buffer) == 0:
+            break
+        lods.append(utils_3d.Mesh.from_buffers(vertices, index_buffer))
+    return lods
+
+
+def with_lods(mesh:utils_3d.Mesh, lods:list[utils_3d.Mesh]) -> utils_3d.Mesh:
+    for level, lod in enumerate(lods, 1):
+        lod.name = f"{mesh.name} (LOD {level})"
+    mesh.set_lods(lods)
     return mesh
 
+
+def _toroid_with_lods(resolution:int) -> utils_3d.Mesh:
+    mesh = toroid_factory(2, 1, resolution)
+    if config.ENABLE_LOD:
+        with_lods(mesh, parametric_lods(lambda lod_resolution: toroid_factory(2, 1, lod_resolution), resolution))
+    return mesh
+
+
+# Meshes are only built when requested, building all of them (and importing the .obj files) is slow
+MODEL_FACTORIES = {
+    config.AvailableMeshes.CUBE: lambda: cube_factory(3),
+    config.AvailableMeshes.TOROID: lambda: _toroid_with_lods(resolution=20),
+    config.AvailableMeshes.TOROID_HIGH_POLY: lambda: _toroid_with_lods(resolution=50),
+    config.AvailableMeshes.PYRAMID: lambda: pyramid_factory(4, 3),
+    config.AvailableMeshes.SHUTTLE: lambda: import_mesh(os.path.join(MODELS_DIR, "shuttle.obj")),
+    config.AvailableMeshes.FLOWER: lambda: import_mesh(os.path.join(MODELS_DIR, "flower.obj")),
+}
+_built_models = {}
+
+
+def get_model(model:config.AvailableMeshes) -> utils_3d.Mesh:
+    """
+    Returns the mesh of one of the available models, building it on first access
+    """
+    if model not in _built_models:
+        _built_models[model] = MODEL_FACTORIES[model]()
+    return _built_models[model]
@@ -0,0 +1,116 @@
+"""
+Compiled mesh format. A small JSON header followed by the raw buffers, each one aligned to ALIGNMENT bytes:
+    MAGIC
+    header size (uint64, little endian)
+    header (JSON): {"name": ..., "source_hash": ..., "lods": [name, ...], "arrays": {name: {"dtype", "shape", "offset"}}}
+    buffers
+The levels of detail of the mesh are stored with it, as lod1_vertices, lod1_indices, lod1_normals, lod2_...
+The buffers are loaded with numpy.memmap, so processes rendering the same model share the same pages. They are mapped
+copy-on-write: a mesh loaded from the cache can be edited like any other, only the edited pages are copied.
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+import numpy as np
+from lib_3d import utils_3d
+
+
+MAGIC = b"SDMESH\x00\x01"
+ALIGNMENT = 64
+FORMAT_VERSION = 4 # 2: normals stored as unit directions, 3: levels of detail stored, 4: welding across grid cells
+
+
+def file_hash(path) -> str:
+    sha = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_path(cache_dir, source_path, source_hash, weld_epsilon:float=None) -> str:
+    base_name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(cache_dir, f"{base_name}.{source_hash[:16]}{_weld_suffix(weld_epsilon)}.v{FORMAT_VERSION}.mesh")
+
+
+def _weld_suffix(weld_epsilon:float=None) -> str:
+    return "" if weld_epsilon is None else f".weld{weld_epsilon:g}"
+
+
+def save_compiled_mesh(path, mesh:utils_3d.Mesh, source_hash:str=""):
+    arrays = {}
+    for prefix, level_mesh in [('', mesh)] + [(f"lod{level}_", lod) for level, lod in enumerate(mesh.lods, 1)]:
+        arrays[f"{prefix}vertices"] = np.ascontiguousarray(level_mesh.rest_vertices, dtype='<f8')
+        arrays[f"{prefix}indices"] = np.ascontiguousarray(level_mesh.index_buffer, dtype='<i8')
+        arrays[f"{prefix}normals"] = np.ascontiguousarray(level_mesh.rest_face_normals, dtype='<f8')
+    header = {'name': mesh.name, 'source_hash': source_hash, 'lods': [lod.name for lod in mesh.lods], 'arrays': {}}
+
+    # Offsets depend on the header size, which depends on the offsets. Reserve room for them first
+    for name, array in arrays.items():
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': 0}
+    data_start = _align(len(MAGIC) + 8 + len(json.dumps(header)) + 32 * len(arrays))
+    offset = data_start
+    for name, array in arrays.items():
+        header['arrays'][name]['offset'] = offset
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode().ljust(data_start - len(MAGIC) - 8)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<Q', len(header_bytes)))
+        file.write(header_bytes)
+        for name, array in arrays.items():
+            file.seek(header['arrays'][name]['offset'])
+            file.write(array.tobytes())
+    os.replace(tmp_path, path) # Other processes never see a partially written file
+
+
+def load_compiled_mesh(path) -> utils_3d.Mesh:
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compiled mesh")
+        header_size, = struct.unpack('<Q', file.read(8))
+        header = json.loads(file.read(header_size))
+
+    arrays = {}
+    for name, info in header['arrays'].items():
+        shape = tuple(info['shape'])
+        if 0 in shape: # numpy.memmap can't map empty arrays
+            arrays[name] = np.zeros(shape, dtype=info['dtype'])
+        else:
+            arrays[name] = np.memmap(path, dtype=info['dtype'], mode='c', offset=info['offset'], shape=shape)
+
+    mesh = utils_3d.Mesh.from_buffers(arrays['vertices'], arrays['indices'], normals=arrays['normals'])
+    mesh.name = header['name']
+    lods = []
+    for level, name in enumerate(header.get('lods', []), 1):
+        prefix = f"lod{level}_"
+        lod = utils_3d.Mesh.from_buffers(arrays[f"{prefix}vertices"], arrays[f"{prefix}indices"], normals=arrays[f"{prefix}normals"])
+        lod.name = name
+        lods.append(lod)
+    mesh.set_lods(lods)
+    return mesh
+
+
+def remove_stale_caches(cache_dir, source_path, keep_path, weld_epsilon:float=None):
+    """
+    Removes the caches of older versions of the source file (other hash or format version) with the same weld
+    epsilon. The caches of other models and of other weld epsilons are kept
+    """
+    base_name = os.path.splitext(os.path.basename(source_path))[0]
+    pattern = re.compile(re.escape(base_name) + r"\.[0-9a-f]{16}" + re.escape(_weld_suffix(weld_epsilon)) + r"\.v\d+\.mesh")
+    for file_name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, file_name)
+        if pattern.fullmatch(file_name) and path != keep_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -1,13 +1,75 @@
+import itertools
 import math
+import numpy as np
 import config
 
+ORTHONORMALIZE_STEPS = 100 # Rotation steps accumulated in Mesh.orientation between two re-orthonormalizations
+
 class Vertex:
+    """
+    A point in 3D space. A standalone vertex owns its coordinates, a vertex that belongs to a Mesh is a thin view
+    over one row of a mesh world space buffer (see Mesh.read_view and Mesh.write_view).
+    """
 
     def __init__(self, x:float=0, y:float=0, z:float=0) -> None:
-        self.x = x
-        self.y = y
-        self.z = z
-    
+        self._data = [x, y, z]
+        self._owner = None
+        self._buffer_name:str = None
+        self._index:int = None
+
+    @property
+    def x(self):
+        if self._owner is not None:
+            return self._owner.read_view(self._buffer_name, self._index, 0)
+        return self._data[0]
+    @x.setter
+    def x(self, value):
+        if self._owner is not None:
+            self._owner.write_view(self._buffer_name, self._index, 0, value)
+        else:
+            self._data[0] = value
+
+    @property
+    def y(self):
+        if self._owner is not None:
+            return self._owner.read_view(self._buffer_name, self._index, 1)
+        return self._data[1]
+    @y.setter
+    def y(self, value):
+        if self._owner is not None:
+            self._owner.write_view(self._buffer_name, self._index, 1, value)
+        else:
+            self._data[1] = value
+
+    @property
+    def z(self):
+        if self._owner is not None:
+            return self._owner.read_view(self._buffer_name, self._index, 2)
+        return self._data[2]
+    @z.setter
+    def z(self, value):
+        if self._owner is not None:
+            self._owner.write_view(self._buffer_name, self._index, 2, value)
+        else:
+            self._data[2] = value
+
+    @property
+    def light_value(self):
+        """
+        Light value of a mesh vertex, for per vertex (Gouraud) shading. See Mesh.apply_light_sources
+        """
+        return self._owner.vertex_light_values[self._index]
+
+    def bind_to_mesh(self, mesh, buffer_name:str, index:int):
+        """
+        Turns the vertex into a view over row `index` of the mesh buffer `buffer_name`. The current coordinates are
+        discarded, the buffer is expected to hold them already
+        """
+        self._owner = mesh
+        self._buffer_name = buffer_name
+        self._index = index
+        self._data = None
+
     def __str__(self) -> str:
         return f"<({self.x}, {self.y}, {self.z})>"
     
@@ -72,9 +134,10 @@ class Vertex:
     
 
     @staticmethod
-    def rotate_vertices_based_on_pivot_point(pivot, vertices_list, dx, dy, dz):
+    def rotation_matrix(dx, dy, dz) -> np.ndarray:
         """
-        Rotate the whole mesh based on rotation matrix https://en.wikipedia.org/wiki/Rotation_matrix (check the 3D Section)
+        Composes the rotations around X, then Y, then Z (in degrees) into a single 3x3 matrix: R = Rz @ Ry @ Rx
+        Check https://en.wikipedia.org/wiki/Rotation_matrix (3D Section)
         Rx = [
             [1  0      0 ]
             [0 cosθ -sinθ]
@@ -91,50 +154,58 @@ class Vertex:
             [0      0   1]
         ]
         """
-        vertices_list:list[Vertex] = vertices_list
-        pivot:Vertex = pivot
-
         theta_x = dx * math.pi / 180  # Convert to radians
         theta_y = dy * math.pi / 180  # Convert to radians
         theta_z = dz * math.pi / 180  # Convert to radians
+        cos_x, sin_x = math.cos(theta_x), math.sin(theta_x)
+        cos_y, sin_y = math.cos(theta_y), math.sin(theta_y)
+        cos_z, sin_z = math.cos(theta_z), math.sin(theta_z)
+        rx = np.array(((1, 0, 0), (0, cos_x, -sin_x), (0, sin_x, cos_x)))
+        ry = np.array(((cos_y, 0, sin_y), (0, 1, 0), (-sin_y, 0, cos_y)))
+        rz = np.array(((cos_z, -sin_z, 0), (sin_z, cos_z, 0), (0, 0, 1)))
+        return rz @ ry @ rx
 
-        # Rotate each vertex
-        for vertex in vertices_list:
-            # Translate vertex to origin (relative to center)
-            dx = vertex.x - pivot.x
-            dy = vertex.y - pivot.y
-            dz = vertex.z - pivot.z
-
-
-            if theta_x != 0:
-                cos_theta_x = math.cos(theta_x)
-                sin_theta_x = math.sin(theta_x)
-                ny = dy * cos_theta_x - dz * sin_theta_x
-                nz = dy * sin_theta_x + dz * cos_theta_x
-                dy = ny
-                dz = nz
-                
-            if theta_y != 0:
-                cos_theta_y = math.cos(theta_y)
-                sin_theta_y = math.sin(theta_y)
-                nx = dx * cos_theta_y + dz * sin_theta_y
-                nz = -dx * sin_theta_y + dz * cos_theta_y
-                dx = nx
-                dz = nz
-                
-            if theta_z != 0:
-                cos_theta_z = math.cos(theta_z)
-                sin_theta_z = math.sin(theta_z)
-                nx = dx * cos_theta_z - dy * sin_theta_z
-                ny = dx * sin_theta_z + dy * cos_theta_z
-                dx = nx
-                dy = ny
-
-            vertex.move_to(
-                dx + pivot.x,
-                dy + pivot.y,
-                dz + pivot.z
-            )
+    @staticmethod
+    def pivot_transform_matrix(pivot, dx, dy, dz) -> np.ndarray:
+        """
+        3x4 affine matrix [R | t] rotating around the pivot point: p' = R @ (p - pivot) + pivot
+        """
+        rotation = Vertex.rotation_matrix(dx, dy, dz)
+        pivot = np.array((pivot.x, pivot.y, pivot.z), dtype=float)
+        return np.hstack((rotation, (pivot - rotation @ pivot)[:, None]))
+
+    @staticmethod
+    def apply_transform(matrix, buffer, out=None) -> np.ndarray:
+        """
+        Applies a 3x4 affine matrix to a (N, 3) buffer of points with a single matrix multiplication
+        """
+        if out is None:
+            out = np.empty_like(buffer, dtype=float)
+        out[:] = buffer @ matrix[:, :3].T + matrix[:, 3]
+        return out
+
+    @staticmethod
+    def rotate_vertices_based_on_pivot_point(pivot, vertices_list, dx, dy, dz):
+        """
+        Rotates the vertices around the pivot point. Check Vertex.rotation_matrix
+        """
+        vertices_list:list[Vertex] = vertices_list
+        if dx == 0 and dy == 0 and dz == 0:
+            return
+        matrix = Vertex.pivot_transform_matrix(pivot, dx, dy, dz)
+        buffer = np.array([(vertex.x, vertex.y, vertex.z) for vertex in vertices_list], dtype=float).reshape(-1, 3)
+        Vertex.apply_transform(matrix, buffer, out=buffer)
+        for vertex, (x, y, z) in zip(vertices_list, buffer.tolist()):
+            vertex.move_to(x, y, z)
+
+    @staticmethod
+    def rotate_buffer_based_on_pivot_point(pivot, buffer, dx, dy, dz):
+        """
+        Same as rotate_vertices_based_on_pivot_point, but rotates a (N, 3) numpy buffer in place
+        """
+        if dx == 0 and dy == 0 and dz == 0:
+            return
+        Vertex.apply_transform(Vertex.pivot_transform_matrix(pivot, dx, dy, dz), buffer, out=buffer)
 
 class Face:
     """
@@ -156,8 +227,23 @@ class Face:
         return self.vertices[3] if len(self.vertices) == 4 else None
     
 
+    @property
+    def light_value(self):
+        if self.index is not None:
+            return self.mesh.light_values[self.index]
+        return self._light_value
+    @light_value.setter
+    def light_value(self, value):
+        if self.index is not None:
+            self.mesh.light_values[self.index] = value
+        else:
+            self._light_value = value
+    
+
     def __init__(self, v1:Vertex, v2:Vertex, v3:Vertex, v4:Vertex=None, flip_normal=False) -> None:
         self.vertices = [v1, v2, v3] + ([v4] if v4 else [])
+        self.mesh:Mesh = None
+        self.index:int = None # Row of this face in the mesh buffers
         self.rotation = Vertex()
         self.light_value = 0 # 0 to 1
         self.normal = Vertex()
@@ -165,8 +251,9 @@ class Face:
         self.calculate_center()
         self.force_normal_flip = flip_normal
 
-    def set_mesh(self, mesh):
+    def set_mesh(self, mesh, index:int=None):
         self.mesh:Mesh = mesh
+        self.index = index
     
     def __str__(self) -> str:
         return f"<Face: {self.v1}, {self.v2}, {self.v3}, {self.v4}>"
@@ -221,11 +308,10 @@ class Face:
             n_y = -n_y
             n_z = -n_z
 
-        # Set the normal vector 0.01 units away from the center
-        offset_length = 0.01
-        self.normal.x = self.center.x + n_x * offset_length
-        self.normal.y = self.center.y + n_y * offset_length
-        self.normal.z = self.center.z + n_z * offset_length
+        # The normal is stored as a unit direction
+        self.normal.x = n_x
+        self.normal.y = n_y
+        self.normal.z = n_z
         
         return self
     
@@ -268,6 +354,9 @@ class Camera:
         self.rotation = Vertex()
         self.display_size = Vertex(1, 1)
         self.recording_surface_size = Vertex(1.6, 1.6, 0.5)
+        self.near_plane = 0.01 # Vertices closer than this (or behind the camera) can't be projected
+        self._view_matrix_key = None
+        self._view_matrix:np.ndarray = None
 
     def move_to(self, x:float, y:float, z:float) -> None:
         self.position.x = x
@@ -301,6 +390,90 @@ class Camera:
             return Vertex(b.x/r.x, b.y/r.y, d.z)
         return b
     
+    def get_view_matrix(self) -> np.ndarray:
+        """
+        3x4 affine matrix taking world positions to the camera space used by project_vertex (d = R @ (v - position)).
+        It is cached until position or rotation change
+        """
+        key = (self.position.x, self.position.y, self.position.z, self.rotation.x, self.rotation.y, self.rotation.z)
+        if key != self._view_matrix_key:
+            sin_x, sin_y, sin_z = math.sin(self.rotation.x), math.sin(self.rotation.y), math.sin(self.rotation.z)
+            cos_x, cos_y, cos_z = math.cos(self.rotation.x), math.cos(self.rotation.y), math.cos(self.rotation.z)
+            # Same rotation as project_vertex, written as a matrix. Check https://en.wikipedia.org/wiki/3D_projection
+            rotation = np.array((
+                (cos_y * cos_z, cos_y * sin_z, -sin_y),
+                (sin_x * sin_y * cos_z - cos_x * sin_z, sin_x * sin_y * sin_z + cos_x * cos_z, sin_x * cos_y),
+                (cos_x * sin_y * cos_z + sin_x * sin_z, cos_x * sin_y * sin_z - sin_x * cos_z, cos_x * cos_y),
+            ))
+            position = np.array(key[:3], dtype=float)
+            self._view_matrix = np.hstack((rotation, (-rotation @ position)[:, None]))
+            self._view_matrix_key = key
+        return self._view_matrix
+
+    def project_many(self, points:np.ndarray) -> np.ndarray:
+        """
+        Batch version of project_vertex(vertex, return_relative_coords=True) for a (N, 3) buffer of points.
+        Returns a (N, 3) array: x and y in the -1 to 1 range of the recording surface, and the view space depth
+        """
+        epsilon = 1e-8 # Avoid divisions by 0
+        d = Vertex.apply_transform(self.get_view_matrix(), points)
+        s = self.display_size
+        r = self.recording_surface_size
+        projected = np.empty_like(d)
+        projected[:, 0] = (d[:, 0] * s.x) / (d[:, 2] * r.x + epsilon) * r.z * -1 / r.x
+        projected[:, 1] = (d[:, 1] * s.y) / (d[:, 2] * r.y + epsilon) * r.z * -1 / r.y
+        projected[:, 2] = d[:, 2]
+        return projected
+
+    def is_sphere_visible(self, center:Vertex, radius:float) -> bool:
+        """
+        Tests a bounding sphere against the view frustum: the near plane and the four planes through the camera
+        where the relative projected x or y is -1 or 1 (|x| * k = depth, with k = display_size / recording_surface_size^2 * zoom)
+        """
+        d = Vertex.apply_transform(self.get_view_matrix(), np.array(((center.x, center.y, center.z),), dtype=float))[0]
+        if d[2] + radius <= self.near_plane:
+            return False
+        k_x, k_y = self.frustum_slopes()
+        for k, coordinate in ((k_x, d[0]), (k_y, d[1])):
+            # Signed distance to the side plane k*|coordinate| - depth = 0
+            if (k * abs(coordinate) - d[2]) / math.sqrt(k * k + 1) > radius:
+                return False
+        return True
+
+    def frustum_slopes(self) -> tuple[float, float]:
+        """
+        (k_x, k_y) such that the relative projected x and y are -x * k_x / depth and -y * k_y / depth
+        """
+        s = self.display_size
+        r = self.recording_surface_size
+        return abs(s.x * r.z / (r.x * r.x)), abs(s.y * r.z / (r.y * r.y))
+
+    def projected_sphere_size(self, center:Vertex, radius:float, h:int, w:int) -> tuple[float, float]:
+        """
+        Approximate radius (columns, lines) in screen cells of a sphere, None when the camera is inside it
+        """
+        depth = Vertex.apply_transform(self.get_view_matrix(), np.array(((center.x, center.y, center.z),), dtype=float))[0, 2]
+        if depth <= radius:
+            return None
+        k_x, k_y = self.frustum_slopes()
+        return radius * k_x / depth * w / 2, radius * k_y / depth * h / 2
+
+    def cull_faces_outside_frustum(self, projected:np.ndarray, index_buffer:np.ndarray, face_indices:np.ndarray) -> np.ndarray:
+        """
+        Keeps the faces that can be on screen, given the vertices projected with project_many. A face is discarded
+        when one of its vertices is behind the near plane (its projection is meaningless) or when all its vertices
+        are beyond the same edge of the recording surface
+        """
+        face_vertex_indices = index_buffer[face_indices]
+        valid_slots = face_vertex_indices >= 0
+        face_points = projected[face_vertex_indices] # (F, 3|4, 3), padded slots are masked below
+        behind = ((face_points[:, :, 2] <= self.near_plane) & valid_slots).any(axis=1)
+        outside = np.zeros(len(face_indices), dtype=bool)
+        for axis in (0, 1):
+            outside |= ((face_points[:, :, axis] < -1) | ~valid_slots).all(axis=1)
+            outside |= ((face_points[:, :, axis] >= 1) | ~valid_slots).all(axis=1)
+        return face_indices[~(behind | outside)]
+
     def relative_move(self, dx:float=0, dy:float=0, dz:float=0):
         rotation = self.rotation
         rotation_sin = Vertex(x=math.sin(rotation.x), y=math.sin(rotation.y), z=math.sin(rotation.z))
@@ -332,122 +505,489 @@ class Camera:
         self.rotation.y = math.atan2(direction.x, direction.z)          # Yaw: left/right
         
 class Mesh:
+    """
+    Array backed mesh. The geometry is kept in rest pose as numpy buffers (structure of arrays):
+        rest_vertices:     (N, 3) vertex positions
+        index_buffer:      (F, 3|4) vertex indices of each face, padded with -1 when triangles and quads are mixed
+        rest_face_centers: (F, 3) center of each face
+        rest_face_normals: (F, 3) unit normal of each face
+        rest_vertex_normals: (N, 3) unit normal of each vertex, average of the normals of its faces
+    The rest pose is never rewritten by rotate_to/move_to, those only update model_matrix (3x4 affine matrix). The
+    world space buffers (vertex_buffer, face_centers, face_normals) are derived from it lazily, the first time
+    they are read after the model matrix changed.
+    Meshes created with instance() share the rest pose buffers and have their own model matrix and light values.
+    The Vertex and Face objects are views over the world space buffers.
+    """
+    WORLD_BUFFERS = ('vertex_buffer', 'face_centers', 'face_normals', 'vertex_normals')
+    DIRECTION_BUFFERS = ('face_normals', 'vertex_normals')
 
-    def __init__(self, faces:list[Face], calculate_normals=True) -> None:
-        self.faces:list[Face] = faces
-        self.computed_vertices_list:list[Vertex] = []
-        self.computed_normals_list:list[Vertex] = []
-        for face in faces:
+    def __init__(self, faces:list[Face], calculate_normals=True, weld_epsilon:float=None) -> None:
+        """
+        Vertices shared by faces are deduplicated by identity. With weld_epsilon, distinct vertices whose positions
+        are within about weld_epsilon of each other are also merged (see weld_vertices)
+        """
+        vertices:list[Vertex] = []
+        vertex_indices:dict[int, int] = {}
+        face_size = max(len(face.vertices) for face in faces)
+        index_buffer = np.full((len(faces), face_size), -1, dtype=np.intp)
+        for face_idx, face in enumerate(faces):
+            face_indices = []
             for vertex in face.vertices:
-                if vertex not in self.computed_vertices_list:
-                    self.computed_vertices_list.append(vertex)
-            self.computed_normals_list.append(face.normal)
-            face.set_mesh(self)
+                vertex_idx = vertex_indices.get(id(vertex))
+                if vertex_idx is None:
+                    vertex_idx = vertex_indices[id(vertex)] = len(vertices)
+                    vertices.append(vertex)
+                face_indices.append(vertex_idx)
+            index_buffer[face_idx, :len(face_indices)] = face_indices
+        rest_vertices = np.array([(vertex.x, vertex.y, vertex.z) for vertex in vertices], dtype=float)
+        rest_face_normals = np.array([(face.normal.x, face.normal.y, face.normal.z) for face in faces], dtype=float)
+
+        vertex_rows = np.arange(len(vertices))
+        if weld_epsilon is not None:
+            rest_vertices, index_buffer, vertex_rows = weld_vertices(rest_vertices, index_buffer, weld_epsilon)
+
+        self._init_buffers(rest_vertices, index_buffer, rest_face_normals)
+        self.light_values[:] = [face.light_value for face in faces]
+
+        # Welded vertices become views over the same row, computed_vertices_list keeps one of them per row
+        self._vertices = [None] * len(rest_vertices)
+        for vertex, row in zip(vertices, vertex_rows.tolist()):
+            vertex.bind_to_mesh(self, 'vertex_buffer', row)
+            if self._vertices[row] is None:
+                self._vertices[row] = vertex
+        self._faces = faces
+        for idx, face in enumerate(faces):
+            self._bind_face(face, idx)
 
-        self.center:Vertex = Vertex()
-        self.calculate_center()
         if calculate_normals:
-            for face in faces:
-                face.calculate_normal(self.center, self)
+            force_normal_flip = np.fromiter((face.force_normal_flip for face in faces), dtype=bool, count=len(faces))
+            self.calculate_normals(force_normal_flip)
+
+    @classmethod
+    def from_buffers(cls, vertices:np.ndarray, index_buffer:np.ndarray, normals:np.ndarray=None, calculate_normals=True, weld_epsilon:float=None):
+        """
+        Creates a mesh straight from a (N, 3) vertex buffer and a (F, 3|4) index buffer.
+        The Vertex and Face views are only created if mesh.faces is accessed
+        """
+        if weld_epsilon is not None:
+            vertices, index_buffer, _ = weld_vertices(np.asarray(vertices, dtype=float), np.asarray(index_buffer), weld_epsilon)
+        mesh = cls.__new__(cls)
+        mesh._init_buffers(np.asarray(vertices, dtype=float), np.asarray(index_buffer, dtype=np.intp), normals)
+        if normals is None and calculate_normals:
+            mesh.calculate_normals()
+        return mesh
+
+    def _init_buffers(self, rest_vertices:np.ndarray, index_buffer:np.ndarray, rest_face_normals:np.ndarray=None):
+        self.rest_vertices = rest_vertices
+        self.index_buffer = index_buffer
+
+        # Padded slots get a weight of 0 so they can be gathered with the rest and ignored
+        valid_slots = self.index_buffer >= 0
+        self.face_sizes = valid_slots.sum(axis=1)
+        self._face_weights = valid_slots / self.face_sizes[:, None]
+
+        self.rest_face_centers = np.einsum('fk,fkc->fc', self._face_weights, self.rest_vertices[self.index_buffer])
+        self.rest_face_normals = rest_face_normals if rest_face_normals is not None else np.zeros((len(index_buffer), 3))
+        self.rest_center = self.rest_vertices.mean(axis=0)
+        self.bounding_radius = float(np.linalg.norm(self.rest_vertices - self.rest_center, axis=1).max())
+        self.rest_vertex_normals = np.zeros_like(self.rest_vertices, dtype=float)
+        self._init_instance_state()
 
+    def _init_instance_state(self):
+        self._rest_buffers = {
+            'vertex_buffer': self.rest_vertices,
+            'face_centers': self.rest_face_centers,
+            'face_normals': self.rest_face_normals,
+            'vertex_normals': self.rest_vertex_normals,
+        }
+        self._world_buffers = {name: np.empty_like(buffer) for name, buffer in self._rest_buffers.items()}
+        self._stale_world_buffers = set(self.WORLD_BUFFERS)
+        self._geometry_version = 0 # Increased when the world space geometry changes
+        self._rest_version = 0 # Increased when the rest pose geometry changes
+        self._vertex_normals_version = None
+        self._lighting_key = None
+        self.light_values = np.zeros(len(self.index_buffer), dtype=float)
+        self.vertex_light_values = np.zeros(len(self.rest_vertices), dtype=float)
+
+        self.model_matrix = np.hstack((np.eye(3), np.zeros((3, 1))))
         self.rotation = Vertex()
+        self.orientation = np.eye(3) # Accumulated rotation matrix, every rotate_to step is applied on top of it
+        self._rotation_steps = 0
+        self.center:Vertex = Vertex(*self.rest_center.tolist())
+        self._vertices:list[Vertex] = None
+        self._faces:list[Face] = None
+        self.lods:list[Mesh] = [] # Coarser versions of the mesh, finest first (see set_lods)
         self.name:str = ""
 
+    def instance(self):
+        """
+        Returns a new mesh sharing this mesh rest pose geometry, with its own model matrix and light values
+        """
+        mesh = Mesh.__new__(Mesh)
+        mesh.rest_vertices = self.rest_vertices
+        mesh.index_buffer = self.index_buffer
+        mesh.face_sizes = self.face_sizes
+        mesh._face_weights = self._face_weights
+        mesh.rest_face_centers = self.rest_face_centers
+        mesh.rest_face_normals = self.rest_face_normals
+        mesh.rest_vertex_normals = self.rest_vertex_normals
+        mesh.rest_center = self.rest_center
+        mesh.bounding_radius = self.bounding_radius
+        mesh._init_instance_state()
+        mesh.lods = [lod.instance() for lod in self.lods]
+        mesh.name = self.name
+        return mesh
+
+    def set_lods(self, lods:list['Mesh']):
+        """
+        Sets the coarser versions of the mesh (finest first) used by select_lod. They pivot around the rest center
+        of this mesh, so they can take its pose as is
+        """
+        for lod in lods:
+            lod.rest_center = self.rest_center
+            lod.bounding_radius = self.bounding_radius
+            lod.center.move_to(*self.rest_center.tolist())
+            lod._update_model_matrix()
+        self.lods = lods
+
+    def select_lod(self, camera:Camera, h:int, w:int, bias:int=0) -> 'Mesh':
+        """
+        Picks the finest level of detail with at most config.LOD_FACES_PER_CELL faces per screen cell covered by the
+        bounding sphere (or the coarsest one), and gives it the pose of this mesh. bias picks that many levels coarser
+        """
+        levels = [self] + self.lods
+        size = camera.projected_sphere_size(self.center, self.bounding_radius, h, w)
+        level = 0
+        if size is not None:
+            face_budget = math.pi * size[0] * size[1] * config.LOD_FACES_PER_CELL
+            while level < len(levels) - 1 and len(levels[level].index_buffer) > face_budget:
+                level += 1
+        lod = levels[min(level + bias, len(levels) - 1)]
+        if lod is not self:
+            lod.center.move_to(self.center.x, self.center.y, self.center.z)
+            lod.rotation.move_to(self.rotation.x, self.rotation.y, self.rotation.z)
+            lod.orientation = self.orientation
+            lod._update_model_matrix()
+        return lod
+
+    def _bind_face(self, face:Face, idx:int):
+        face.center.bind_to_mesh(self, 'face_centers', idx)
+        face.normal.bind_to_mesh(self, 'face_normals', idx)
+        face.set_mesh(self, idx)
+
+    @property
+    def computed_vertices_list(self) -> list[Vertex]:
+        if self._vertices is None:
+            self._vertices = [Vertex() for _ in range(len(self.rest_vertices))]
+            for idx, vertex in enumerate(self._vertices):
+                vertex.bind_to_mesh(self, 'vertex_buffer', idx)
+        return self._vertices
+
+    @property
+    def faces(self) -> list[Face]:
+        if self._faces is None:
+            vertices = self.computed_vertices_list
+            self._faces = []
+            for idx, face_indices in enumerate(self.index_buffer.tolist()):
+                face = Face(*[vertices[vertex_idx] for vertex_idx in face_indices if vertex_idx >= 0])
+                self._bind_face(face, idx)
+                self._faces.append(face)
+        return self._faces
+
+    @property
+    def computed_normals_list(self) -> list[Vertex]:
+        return [face.normal for face in self.faces]
+
+    @property
+    def vertex_buffer(self) -> np.ndarray:
+        return self._get_world_buffer('vertex_buffer')
+
+    @property
+    def face_centers(self) -> np.ndarray:
+        return self._get_world_buffer('face_centers')
+
+    @property
+    def face_normals(self) -> np.ndarray:
+        return self._get_world_buffer('face_normals')
+
+    @property
+    def vertex_normals(self) -> np.ndarray:
+        self._update_rest_vertex_normals()
+        return self._get_world_buffer('vertex_normals')
+
+    def _update_rest_vertex_normals(self):
+        """
+        Vertex normals are only needed for per vertex shading, they are computed on first use and after the rest
+        pose changed
+        """
+        if self._vertex_normals_version == self._rest_version:
+            return
+        valid_slots = self.index_buffer >= 0
+        vertex_indices = self.index_buffer[valid_slots]
+        face_normals = np.broadcast_to(self.rest_face_normals[:, None, :], self.index_buffer.shape + (3,))[valid_slots]
+        for axis in range(3):
+            self.rest_vertex_normals[:, axis] = np.bincount(vertex_indices, weights=face_normals[:, axis], minlength=len(self.rest_vertices))
+        length = np.linalg.norm(self.rest_vertex_normals, axis=1)
+        np.divide(self.rest_vertex_normals, length[:, None], out=self.rest_vertex_normals, where=length[:, None] != 0)
+        self._vertex_normals_version = self._rest_version
+        self._stale_world_buffers.add('vertex_normals')
+
+    def _get_world_buffer(self, name:str) -> np.ndarray:
+        buffer = self._world_buffers[name]
+        if name in self._stale_world_buffers:
+            if name in self.DIRECTION_BUFFERS: # Directions are only rotated
+                np.matmul(self._rest_buffers[name], self.model_matrix[:, :3].T, out=buffer)
+            else:
+                Vertex.apply_transform(self.model_matrix, self._rest_buffers[name], out=buffer)
+            self._stale_world_buffers.discard(name)
+        return buffer
+
+    def update_world_buffers(self):
+        """
+        Derives the stale world space buffers used by every frame now, instead of on their first read
+        """
+        for name in ('vertex_buffer', 'face_centers', 'face_normals'):
+            self._get_world_buffer(name)
+
+    def read_view(self, buffer_name:str, index:int, axis:int):
+        return self._get_world_buffer(buffer_name)[index, axis]
+
+    def write_view(self, buffer_name:str, index:int, axis:int, value):
+        """
+        A write through a Vertex view edits the geometry: the new world position is taken back to rest pose
+        (shared by every instance of the mesh)
+        """
+        world_row = self._get_world_buffer(buffer_name)[index]
+        world_row[axis] = value
+        self._geometry_version += 1
+        self._rest_version += 1
+        rotation = self.model_matrix[:, :3]
+        if buffer_name in self.DIRECTION_BUFFERS:
+            self._rest_buffers[buffer_name][index] = rotation.T @ world_row
+        else:
+            self._rest_buffers[buffer_name][index] = rotation.T @ (world_row - self.model_matrix[:, 3])
+
     def __str__(self) -> str:
-        return f"<Mesh with {len(self.faces)} faces>"
+        return f"<Mesh with {len(self.index_buffer)} faces>"
 
     
     
     def calculate_center(self):
-        sum_x, sum_y, sum_z = 0,0,0
-        amount_of_vertices = len(self.computed_vertices_list)
-        for vertex in self.computed_vertices_list:
-            sum_x += vertex.x
-            sum_y += vertex.y
-            sum_z += vertex.z
-        
-        sum_x /= amount_of_vertices
-        sum_y /= amount_of_vertices
-        sum_z /= amount_of_vertices
+        self.rest_center = self.rest_vertices.mean(axis=0)
+        center = Vertex.apply_transform(self.model_matrix, self.rest_center[None, :])[0]
+        self.center.move_to(*center.tolist())
 
-        self.center.x = sum_x
-        self.center.y = sum_y
-        self.center.z = sum_z
-        
+    def calculate_normals(self, force_normal_flip:np.ndarray=None):
+        """
+        Batch version of Face.calculate_normal for every face of the mesh (in rest pose)
+        """
+        v1 = self.rest_vertices[self.index_buffer[:, 0]]
+        v2 = self.rest_vertices[self.index_buffer[:, 1]]
+        v3 = self.rest_vertices[self.index_buffer[:, 2]]
+        normals = np.cross(v2 - v1, v3 - v1)
+
+        length = np.linalg.norm(normals, axis=1)
+        np.divide(normals, length[:, None], out=normals, where=length[:, None] != 0)
+
+        # Normals pointing to the mesh center are flipped
+        to_mesh_center = self.rest_center - self.rest_face_centers
+        normals[np.einsum('fc,fc->f', normals, to_mesh_center) > 0] *= -1
+        if force_normal_flip is not None:
+            normals[force_normal_flip] *= -1
+
+        self.rest_face_normals[:] = normals
+        self._stale_world_buffers.add('face_normals')
+        self._geometry_version += 1
+        self._rest_version += 1
+
+    def _update_model_matrix(self):
+        """
+        model = T(center) @ R(orientation) @ T(-rest_center)
+        """
+        translation = (self.center.x, self.center.y, self.center.z) - self.orientation @ self.rest_center
+        self.model_matrix = np.hstack((self.orientation, translation[:, None]))
+        self._stale_world_buffers.update(self.WORLD_BUFFERS)
+        self._geometry_version += 1
 
     def move_to(self, x:float=0, y:float=0, z:float=0):
-        relative_change = Vertex(x - self.center.x, y - self.center.y, z - self.center.z)
-        self.center.x = x
-        self.center.y = y
-        self.center.z = z
-        for face in self.faces:
-            new_face_x = face.center.x + relative_change.x
-            new_face_y = face.center.y + relative_change.y
-            new_face_z = face.center.z + relative_change.z
-            face.move_to(new_face_x, new_face_y, new_face_z)
+        if (x, y, z) == (self.center.x, self.center.y, self.center.z):
+            return
+        self.center.move_to(x, y, z)
+        self._update_model_matrix()
 
     def rotate_to(self, x: float = None, y: float = None, z: float = None):
-        
-        theta_x, theta_y, theta_z = 0, 0, 0
-        # Calculate rotation differences
-        if x is not None:
-            theta_x = (x - self.rotation.x)
-            self.rotation.x = x
-        
-        if y is not None:
-            theta_y = (y - self.rotation.y)
-            self.rotation.y = y
-        
-        if z is not None:
-            theta_z = (z - self.rotation.z)
-            self.rotation.z = z
-        
-        # To avoid recalculating the normal, we can put it on the list as a vertex. it will be rotated as it is supposed to
-        vertices_list = self.computed_normals_list + self.computed_vertices_list
-        Vertex.rotate_vertices_based_on_pivot_point(self.center, vertices_list, theta_x, theta_y, theta_z)
-
-        for face in self.faces:
-            face.calculate_center()
-
-    def depth_sort_faces(self, camera:Camera):
-        def backface_culling(face:Face):
-            face_angle_to_camera = Vertex.three_vertex_angle(face.center, face.normal, camera.position)
-            if face_angle_to_camera < 90:
-                return True
-            return False
-
-        def score_face(face:Face):
-            d_s = 0
-            d_s += Vertex.distance(face.v1, camera.position)
-            d_s += Vertex.distance(face.v2, camera.position)
-            d_s += Vertex.distance(face.v3, camera.position)
-            if face.v4:
-                d_s += Vertex.distance(face.v4, camera.position)
-            return d_s
+        """
+        Rotates the mesh around its center by the difference (in degrees) between the given and the current rotation,
+        around the world axes, as the vertices used to be rotated every frame. The steps are accumulated in the
+        orientation matrix, which is re-orthonormalized every ORTHONORMALIZE_STEPS steps so it doesn't drift.
+        Nothing is recomputed here, the world space buffers are derived from the new model matrix when they are needed
+        """
+        x = self.rotation.x if x is None else x
+        y = self.rotation.y if y is None else y
+        z = self.rotation.z if z is None else z
+        if (x, y, z) == (self.rotation.x, self.rotation.y, self.rotation.z):
+            return
+        step = Vertex.rotation_matrix(x - self.rotation.x, y - self.rotation.y, z - self.rotation.z)
+        self.orientation = step @ self.orientation
+        self._rotation_steps += 1
+        if self._rotation_steps % ORTHONORMALIZE_STEPS == 0:
+            u, _, vt = np.linalg.svd(self.orientation)
+            self.orientation = u @ vt
+        self.rotation.move_to(x, y, z)
+        self._update_model_matrix()
 
+    def backface_culling_mask(self, camera:Camera) -> np.ndarray:
+        """
+        (F,) bool mask of the faces facing the camera: the angle between the face normal and the direction to the
+        camera is below 90 degrees, which is the sign of their dot product
+        """
+        camera_position = np.array((camera.position.x, camera.position.y, camera.position.z), dtype=float)
+        return np.einsum('fc,fc->f', self.face_normals, camera_position - self.face_centers) > 0
 
-        faces = []
+    def depth_sort_face_indices(self, camera:Camera, sort=True) -> np.ndarray:
+        """
+        Returns the indices of the faces facing the camera (if backface culling is enabled), from the farthest to
+        the closest one. With sort=False they are returned in mesh order, for when a depth buffer takes care of the
+        occlusion
+        """
         if config.ENABLE_BACKFACE_CULLING:
-            for f in self.faces:
-                if backface_culling(f):
-                    faces.append(f)
+            visible_faces = np.flatnonzero(self.backface_culling_mask(camera))
         else:
-            faces = self.faces
-        # print(f"{len(faces)}/{len(self.faces)}")
-        return sorted(faces, key=lambda x: score_face(x), reverse=True)
+            visible_faces = np.arange(len(self.index_buffer))
+
+        if not sort:
+            return visible_faces
+
+        # Score is the summed distance from the face vertices to the camera
+        camera_position = np.array((camera.position.x, camera.position.y, camera.position.z), dtype=float)
+        vertex_distances = np.linalg.norm(self.vertex_buffer - camera_position, axis=1)
+        scores = np.where(self.index_buffer >= 0, vertex_distances[self.index_buffer], 0).sum(axis=1)
+
+        # print(f"{len(visible_faces)}/{len(self.faces)}")
+        return visible_faces[np.argsort(-scores[visible_faces], kind='stable')]
+
+    def depth_sort_faces(self, camera:Camera, sort=True) -> list[Face]:
+        """
+        Same as depth_sort_face_indices, returning the Face views
+        """
+        faces = self.faces
+        return [faces[idx] for idx in self.depth_sort_face_indices(camera, sort)]
     
     def apply_light_source(self, source:Vertex, intensity:float=1):
-        distance_modifier = 0.1
-        for face in self.faces:
-            adjusted_intensity = float(intensity)
-            d = Vertex.distance(face.center, source)
-            adjusted_intensity = adjusted_intensity / ((d * distance_modifier)**2)
-            
-            # A narrow angle means that the face is looking at the light, a broad angle means it's facing away from the light source
-            angle = Vertex.three_vertex_angle(face.center, face.normal, source)
-            angle_modifier = angle/180
-            adjusted_intensity = adjusted_intensity*angle_modifier
-            face.light_value = adjusted_intensity
+        self.apply_light_sources([(source, intensity)])
+
+    def apply_light_sources(self, light_sources:list[tuple[Vertex, float]]):
+        """
+        Sets the light value of every face from a list of (position, intensity) light sources, see
+        compute_face_lighting. With config.ENABLE_GOURAUD_SHADING the light value of every vertex is computed too,
+        from the vertex normals. Nothing is recomputed if neither the lights nor the mesh changed since the last call
+        """
+        positions = np.array([(source.x, source.y, source.z) for source, _ in light_sources], dtype=float).reshape(-1, 3)
+        intensities = np.array([intensity for _, intensity in light_sources], dtype=float)
+        lighting_key = (self._geometry_version, positions.tobytes(), intensities.tobytes(), config.ENABLE_GOURAUD_SHADING)
+        if lighting_key == self._lighting_key:
+            return
+        compute_face_lighting(self.face_centers, self.face_normals, positions, intensities, out=self.light_values)
+        if config.ENABLE_GOURAUD_SHADING:
+            compute_face_lighting(self.vertex_buffer, self.vertex_normals, positions, intensities, out=self.vertex_light_values)
+        self._lighting_key = lighting_key
+
+
+def compute_face_lighting(face_centers:np.ndarray, face_normals:np.ndarray, light_positions:np.ndarray, light_intensities:np.ndarray, out:np.ndarray=None) -> np.ndarray:
+    """
+    Lambert lighting of all the faces for all the lights at once, with the light fading with the squared distance:
+        light_value = sum(intensity * max(0, normal . direction_to_light) / (distance * 0.1)^2)
+    face_centers and face_normals are (F, 3) arrays, light_positions is (L, 3) and light_intensities (L,).
+    Also used for per vertex lighting, with vertex positions and normals instead of the face ones
+    """
+    distance_modifier = 0.1
+    to_light = light_positions[None, :, :] - face_centers[:, None, :] # (F, L, 3)
+    d = np.linalg.norm(to_light, axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lambert = np.einsum('fc,flc->fl', face_normals, to_light) / d
+        adjusted_intensity = light_intensities / ((d * distance_modifier)**2)
+    light = np.nan_to_num(np.maximum(lambert, 0) * adjusted_intensity)
+    return np.sum(light, axis=1, out=out)
+
+
+def weld_vertices(vertices:np.ndarray, index_buffer:np.ndarray, epsilon:float):
+    """
+    Merges vertices closer than epsilon / 2 on every axis, keeping the first occurrence of each group.
+    Two close points can fall on both sides of a cell boundary of a grid of size epsilon, so the vertices are grouped
+    in 8 grids shifted by half a cell on each axis: the points are in the same cell in at least one of them. Vertices
+    sharing a cell in any grid are merged (transitively), a single merge never spans epsilon or more on an axis.
+    Returns the welded vertex buffer, the remapped index buffer (-1 padding is kept) and the new row of every
+    original vertex
+    """
+    grid_cells = []
+    for offset in itertools.product((0, 0.5), repeat=3):
+        keys = np.floor(vertices / epsilon + offset).astype(np.int64)
+        grid_cells.append(np.unique(keys, axis=0, return_inverse=True)[1].reshape(-1))
+
+    # Every vertex points to the first vertex of its group, propagated through the cells until nothing changes
+    labels = np.arange(len(vertices))
+    changed = True
+    while changed:
+        changed = False
+        for cells in grid_cells:
+            cell_first = np.full(cells.max() + 1, len(vertices))
+            np.minimum.at(cell_first, cells, labels)
+            new_labels = cell_first[cells]
+            new_labels = new_labels[new_labels]
+            if (new_labels != labels).any():
+                labels = new_labels
+                changed = True
+
+    # The labels are first occurrences, sorting them keeps the original vertex order
+    first_occurrence, vertex_rows = np.unique(labels, return_inverse=True)
+    vertex_rows = vertex_rows.reshape(-1)
+    welded_index_buffer = np.where(index_buffer >= 0, vertex_rows[index_buffer], -1)
+    return vertices[first_occurrence], welded_index_buffer, vertex_rows
+
+
+COLLAPSE_PASS_DIVISOR = 16 # A decimation pass collapses at most 1/16 of the face count
+
+
+def collapse_edges(vertices:np.ndarray, index_buffer:np.ndarray, target_faces:int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decimates a triangle mesh by collapsing its shortest edges into their midpoint until it has about target_faces
+    faces. Every pass collapses edges that don't share vertices, shortest first, and removes the faces that became
+    degenerate (each collapse removes the two faces of the edge). Returns the new vertex and index buffers
+    """
+    vertices = vertices.copy()
+    faces = index_buffer
+    while len(faces) > target_faces:
+        edges = np.unique(np.sort(np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]])), axis=1), axis=0)
+        lengths = np.linalg.norm(vertices[edges[:, 0]] - vertices[edges[:, 1]], axis=1)
+        # Small passes over the shorter half of the edges, so long edges (the silhouette of big flat parts) survive
+        max_collapses = max(min((len(faces) - target_faces) // 2, len(faces) // COLLAPSE_PASS_DIVISOR), 1)
+        short_edges = edges[lengths <= np.median(lengths)]
+        short_lengths = lengths[lengths <= np.median(lengths)]
+
+        remap = np.arange(len(vertices))
+        touched = [False] * len(vertices)
+        collapses = 0
+        for a, b in short_edges[np.argsort(short_lengths, kind='stable')].tolist():
+            if touched[a] or touched[b]:
+                continue
+            touched[a] = touched[b] = True
+            remap[b] = a
+            vertices[a] = (vertices[a] + vertices[b]) / 2
+            collapses += 1
+            if collapses == max_collapses:
+                break
+        if collapses == 0:
+            break
+
+        faces = remap[faces]
+        degenerate = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 2] == faces[:, 0])
+        faces = faces[~degenerate]
+
+    # Drop the vertices that are no longer used
+    used_vertices = np.unique(faces)
+    new_rows = np.full(len(vertices), -1, dtype=np.intp)
+    new_rows[used_vertices] = np.arange(len(used_vertices))
+    return vertices[used_vertices], new_rows[faces]
 
 
 def setup_camera(cam):
@@ -460,6 +1000,25 @@ def setup_camera(cam):
     cam.recording_surface_size.z = sensor_size[2]
 
 
+def create_camera() -> Camera:
+    """
+    Camera at config.CAMERA_SETTINGS position, set up with setup_camera
+    """
+    cam = Camera(Vertex(*config.CAMERA_SETTINGS.get('POSITION', (0,0,-5))))
+    setup_camera(cam)
+    return cam
+
+
+def create_light_sources() -> list[tuple[Vertex, float]]:
+    """
+    (position, intensity) of config.LIGHT_SOURCE and config.EXTRA_LIGHT_SOURCES
+    """
+    return [
+        (Vertex(*light.get('POSITION', (0,0,-5))), light.get('INTENSITY', 1))
+        for light in [config.LIGHT_SOURCE] + config.EXTRA_LIGHT_SOURCES
+    ]
+
+
 
 
 def ray_triangle_intersection(ray_origin: Vertex, ray_direction: Vertex, v1: Vertex, v2: Vertex, v3: Vertex):
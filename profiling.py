@@ -0,0 +1,190 @@
+import functools
+import time
+import numpy as np
+import config
+import terminal_drawing
+import tiled_drawing
+from lib_3d.utils_3d import Mesh, Camera
+
+# Per frame values recorded in the ring buffer. The stages are in milliseconds
+STAGES = ('rotate', 'light', 'sort', 'project', 'rasterize', 'output')
+COUNTERS = ('faces_culled', 'cells_filled', 'bytes_written')
+FIELDS = STAGES + COUNTERS
+
+
+class Profiler:
+    """
+    Keeps the per stage timings and counters of the last `capacity` frames in a ring buffer (a preallocated numpy
+    array, nothing is allocated per frame). The hooks added by install() accumulate into the current frame,
+    end_frame() stores it
+    """
+
+    def __init__(self, capacity:int=600) -> None:
+        self.frames = np.zeros((capacity, len(FIELDS)))
+        self.current = np.zeros(len(FIELDS))
+        self.frame_count = 0
+
+    def end_frame(self):
+        self.frames[self.frame_count % len(self.frames)] = self.current
+        self.current[:] = 0
+        self.frame_count += 1
+
+    def recorded_frames(self) -> np.ndarray:
+        """
+        Recorded frames, oldest first
+        """
+        if self.frame_count <= len(self.frames):
+            return self.frames[:self.frame_count]
+        start = self.frame_count % len(self.frames)
+        return np.concatenate((self.frames[start:], self.frames[:start]))
+
+    def averages(self, window:int=30) -> dict:
+        """
+        Rolling average of every field over the last `window` frames
+        """
+        frames = self.recorded_frames()[-window:]
+        if len(frames) == 0:
+            return dict.fromkeys(FIELDS, 0.0)
+        return dict(zip(FIELDS, frames.mean(axis=0).tolist()))
+
+    def export(self, path:str):
+        """
+        Writes the recorded frames as CSV, one row per frame
+        """
+        np.savetxt(path, self.recorded_frames(), delimiter=',', header=','.join(FIELDS), comments='', fmt='%.6g')
+
+
+_profiler:Profiler = None
+_originals:list[tuple[object, str, object]] = [] # (owner, attribute, unwrapped function) of every hook installed
+
+
+def _timed(func, stage:str):
+    field = FIELDS.index(stage)
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        _profiler.current[field] += (time.perf_counter() - start) * 1000
+        return result
+    return wrapper
+
+
+def _counting_culled(func, culled_count):
+    field = FIELDS.index('faces_culled')
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        _profiler.current[field] += culled_count(args, result)
+        return result
+    return wrapper
+
+
+def _counting_output(func):
+    field = FIELDS.index('bytes_written')
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        _profiler.current[field] += len(result)
+        return result
+    return wrapper
+
+
+def _counting_spans(func):
+    """
+    Counts the cells of the spans rasterized by fill_polygon (before the depth test)
+    """
+    field = FIELDS.index('cells_filled')
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for span in func(*args, **kwargs):
+            _profiler.current[field] += span[2] - span[1]
+            yield span
+    return wrapper
+
+
+def _counting_sub_cell_faces(func):
+    """
+    Counts the faces splatted as a single cell by rasterize_faces (it returns how many it wrote), the other faces go
+    through fill_polygon
+    """
+    field = FIELDS.index('cells_filled')
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        splatted_faces = func(*args, **kwargs)
+        _profiler.current[field] += splatted_faces
+        return splatted_faces
+    return wrapper
+
+
+def _transforming(func, drawn_mesh):
+    """
+    The world space buffers are derived lazily, they are built right after the pose changes so the transform is
+    counted in the rotate stage as in benchmark.py, instead of in the first stage reading them
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        mesh = drawn_mesh(args, result)
+        if mesh is not None:
+            mesh.update_world_buffers()
+        return result
+    return wrapper
+
+
+def install(profiler:Profiler):
+    """
+    Wraps the hot path functions so they record into the profiler. Nothing is wrapped unless this is called, so
+    there is no overhead at all when profiling is disabled.
+    The stages match benchmark.py: rotate includes picking the level of detail and transforming the drawn mesh.
+    The legacy per face path (draw_face_on_screen) projects and rasterizes each face at once, it is all rasterize.
+    apply_light_source and depth_sort_faces go through apply_light_sources and depth_sort_face_indices.
+    cells_filled counts the cells rasterized in this process, not those of the TiledRenderer workers
+    """
+    global _profiler
+    if _profiler is not None:
+        _profiler = profiler # Already wrapped, only record somewhere else
+        return
+    _profiler = profiler
+
+    def hook(owner, name:str, wrap):
+        _originals.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, wrap(getattr(owner, name)))
+
+    # With config.ENABLE_LOD the drawn mesh is the one returned by select_lod, only that one is transformed
+    hook(Mesh, 'rotate_to', lambda func: _timed(_transforming(func, lambda args, result: None if config.ENABLE_LOD else args[0]), 'rotate'))
+    hook(Mesh, 'select_lod', lambda func: _timed(_transforming(func, lambda args, result: result), 'rotate'))
+    hook(Mesh, 'apply_light_sources', lambda func: _timed(func, 'light'))
+    hook(Mesh, 'depth_sort_face_indices', lambda func: _timed(
+        _counting_culled(func, lambda args, result: len(args[0].index_buffer) - len(result)), 'sort'
+    ))
+    hook(Camera, 'cull_faces_outside_frustum', lambda func: _counting_culled(func, lambda args, result: len(args[3]) - len(result)))
+    hook(terminal_drawing, 'project_mesh_faces', lambda func: _timed(func, 'project'))
+    hook(terminal_drawing, 'draw_face_on_screen', lambda func: _timed(func, 'rasterize'))
+    hook(tiled_drawing.TiledRenderer, 'rasterize_bands', lambda func: _timed(func, 'rasterize'))
+    hook(terminal_drawing, 'triangle_spans', _counting_spans)
+    hook(terminal_drawing, 'rasterize_faces', lambda func: _timed(_counting_sub_cell_faces(func), 'rasterize'))
+    hook(terminal_drawing, 'frame_output', _counting_output)
+    hook(terminal_drawing, 'draw_screen', lambda func: _timed(func, 'output'))
+
+
+def uninstall():
+    """
+    Puts back the functions wrapped by install()
+    """
+    global _profiler
+    while _originals:
+        owner, name, func = _originals.pop()
+        setattr(owner, name, func)
+    _profiler = None
+
+
+def draw_overlay(profiler:Profiler, screen:terminal_drawing.ScreenBuffer, window:int=30):
+    """
+    Writes the rolling averages on the top left corner of the screen
+    """
+    averages = profiler.averages(window)
+    lines = [f"{stage:<10}{averages[stage]:7.2f} ms" for stage in STAGES]
+    lines += [f"{counter:<14}{averages[counter]:6.0f}" for counter in COUNTERS]
+    for y, line in enumerate(lines[:screen.height]):
+        text = line[:screen.width].encode('ascii')
+        screen[y][:len(text)] = np.frombuffer(text, dtype=np.uint8)
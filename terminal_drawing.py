@@ -1,16 +1,77 @@
 import os
 import sys
-from PIL import Image, ImageDraw, ImageFont
+import signal
 import string
+import json
+import importlib.metadata
+import math
+import numpy as np
 import config
-from lib_3d.utils_3d import Camera, Vertex, Face
+from lib_3d.utils_3d import Camera, Vertex, Face, Mesh
 import random
+from collections import namedtuple, deque
+import threading
+
+# Output of _compute_ascii_list with Pillow's default font at size 16 (Pillow 10.4), so Pillow isn't needed to start
+DEFAULT_FONT_SIZE = 16
+DEFAULT_ASCII_RAMP = " `.,:-;'_~\\/\"^><i=!*r+I)(lj?t1}{vf7z|LJcx][TsYyoFa2#nuZVek3XC4A5PhESU0bpdqK69HORwG8D&gmQ%B$NWM@"
+ASCII_RAMP_CACHE_FILE = "ascii_ramps.json"
+SCALAR_FILL_CELLS = 96 # Depth tested triangles up to this many cells are filled with a plain loop (see _fill_triangle_with_depth)
+
+
+def generate_ascii_list(font_path:str=None, font_size:int=DEFAULT_FONT_SIZE, regenerate=False):
+    """
+    Returns the printable characters sorted by the amount of white pixels they draw, preceded by a blank.
+    The default font uses the built-in DEFAULT_ASCII_RAMP. Other fonts are rendered with Pillow once and cached on
+    disk (config.CACHE_DIR), keyed by font file (path and modification time), size and Pillow version
+    """
+    if font_path is None and font_size == DEFAULT_FONT_SIZE and not regenerate:
+        return list(DEFAULT_ASCII_RAMP)
+
+    cache_path = os.path.join(config.CACHE_DIR, ASCII_RAMP_CACHE_FILE)
+    cache_key = _ascii_ramp_cache_key(font_path, font_size)
+    try:
+        with open(cache_path) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        cache = {}
+
+    if cache_key in cache and not regenerate:
+        return list(cache[cache_key])
+
+    ascii_list = _compute_ascii_list(font_path, font_size)
+    cache[cache_key] = "".join(ascii_list)
+    try:
+        os.makedirs(config.CACHE_DIR, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(cache, file, indent=1)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass # Caching is only an optimization
+    return ascii_list
+
+
+def _ascii_ramp_cache_key(font_path:str, font_size:int):
+    if font_path is None:
+        font_id = "default"
+    else:
+        font_id = f"{os.path.abspath(font_path)}@{os.path.getmtime(font_path)}"
+    try:
+        pillow_version = importlib.metadata.version("pillow")
+    except importlib.metadata.PackageNotFoundError:
+        pillow_version = "unknown"
+    return f"{font_id}|{font_size}|pillow-{pillow_version}"
+
+
+def _compute_ascii_list(font_path:str=None, font_size:int=DEFAULT_FONT_SIZE):
+    from PIL import Image, ImageDraw, ImageFont
 
-def generate_ascii_list():
-    # Font settings (default system font)
-    font_size = 16
     try:
-        font = ImageFont.load_default()
+        if font_path is None:
+            font = ImageFont.load_default() # Font settings (default system font)
+        else:
+            font = ImageFont.truetype(font_path, font_size)
     except IOError:
         print("Error loading default font.")
 
@@ -35,11 +96,76 @@ def generate_ascii_list():
     return [" "] + sorted_chars
 
 
-def get_screen_matrix():
-    size = os.get_terminal_size()
-    columns = size.columns
-    rows = size.lines
-    return [[None] * columns for _ in range(rows)]
+class ScreenBuffer:
+    """
+    Character buffer of the terminal screen, allocated once and reused every frame.
+    The characters are stored as a (lines, columns) numpy uint8 array of ASCII codes, so the rasterizer writes row
+    slices straight into it. The buffer is only reallocated when the terminal is resized (SIGWINCH).
+    """
+    BLANK = ord(' ')
+
+    def __init__(self, columns:int=None, lines:int=None, data:np.ndarray=None) -> None:
+        """
+        data wraps an existing (lines, columns) uint8 array (e.g. in shared memory) instead of allocating one
+        """
+        self.data:np.ndarray = None
+        self.last_frame:np.ndarray = None # Frame previously written to the terminal, used to write only the changes
+        self.depth_buffer:np.ndarray = None
+        self._resize_requested = False
+        if data is not None:
+            self.data = data
+            self._spare = np.empty_like(data)
+        else:
+            self.resize(columns, lines)
+
+    @property
+    def width(self):
+        return self.data.shape[1]
+
+    @property
+    def height(self):
+        return self.data.shape[0]
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y):
+        """
+        Row view, writes go straight to the buffer
+        """
+        return self.data[y]
+
+    def resize(self, columns:int=None, lines:int=None):
+        if columns is None or lines is None:
+            size = os.get_terminal_size()
+            columns = size.columns
+            lines = size.lines
+        self.data = np.full((lines, columns), self.BLANK, dtype=np.uint8)
+        self._spare = np.empty_like(self.data)
+        self.last_frame = None
+        self.depth_buffer = None
+
+    def watch_terminal_resize(self):
+        if hasattr(signal, 'SIGWINCH'): # Not available on Windows
+            signal.signal(signal.SIGWINCH, self._sigwinch_handler)
+
+    def _sigwinch_handler(self, signal, frame):
+        # Only flag it, reallocating in the middle of a frame would break the rasterizer
+        self._resize_requested = True
+
+    def clear(self):
+        if self._resize_requested:
+            self._resize_requested = False
+            self.resize()
+        self.data.fill(self.BLANK)
+
+    def swap(self):
+        """
+        Keeps the current frame as last_frame and takes the old last_frame as the buffer of the next frame
+        """
+        spare = self.last_frame if self.last_frame is not None else self._spare
+        self.last_frame = self.data
+        self.data = spare
 
 
 def is_point_in_triangle(x, y, triangle:list[Vertex]):
@@ -71,34 +197,230 @@ def get_bounding_box_from_virtual_vertices(vertices):
     return {'min_x': min_x, 'max_x': max_x, 'min_y': min_y, 'max_y':max_y}
 
 
-def draw_face_on_screen(face: Face, cam:Camera, screen, ascii_list):
-    h, w = (len(screen), len(screen[0]))
+# Vertex projected to the screen: x and y in cells, z is the view space depth
+ScreenPoint = namedtuple('ScreenPoint', ('x', 'y', 'z'))
+
+
+def triangle_spans(v1:ScreenPoint, v2:ScreenPoint, v3:ScreenPoint, h:int, w:int, rows:tuple[int, int]=None):
+    """
+    Scanline rasterization of a triangle in screen coords. Yields (y, start_x, end_x) for every row, end_x exclusive.
+    rows (first, end) limits the rasterization to a band of the screen.
+    Each edge function E(x, y) = a*x + k(y) is linear, so for a row the cells where E >= 0 are a half line of x
+    that is found with one division, and k(y) is updated incrementally from one row to the next
+    """
+    # Make the winding counter clockwise so the inside of the triangle is E >= 0 for all the edges
+    area = (v2.x - v1.x) * (v3.y - v1.y) - (v2.y - v1.y) * (v3.x - v1.x)
+    if area == 0:
+        return
+    if area > 0:
+        v2, v3 = v3, v2
+
+    first_row, end_row = rows if rows is not None else (0, h)
+    min_y = max(int(math.ceil(min(v1.y, v2.y, v3.y))), first_row)
+    max_y = min(int(math.floor(max(v1.y, v2.y, v3.y))), end_row - 1)
+    if min_y > max_y:
+        return
+
+    EPSILON = 1e-9  # A small value to account for precision errors
+    edges = []
+    for a, b in ((v1, v2), (v2, v3), (v3, v1)):
+        edge_a = b.y - a.y
+        edge_dk = a.x - b.x
+        edge_k = (min_y - a.y) * edge_dk - a.x * edge_a
+        edges.append([edge_a, edge_k, edge_dk])
+
+    for y in range(min_y, max_y + 1):
+        start_x = 0
+        end_x = w - 1
+        for edge in edges:
+            edge_a, edge_k, edge_dk = edge
+            if edge_a > 0:
+                start_x = max(start_x, math.ceil(-edge_k / edge_a - EPSILON))
+            elif edge_a < 0:
+                end_x = min(end_x, math.floor(-edge_k / edge_a + EPSILON))
+            elif edge_k < 0:
+                end_x = -1
+            edge[1] = edge_k + edge_dk
+        if start_x <= end_x:
+            yield y, start_x, end_x + 1
+
+
+def get_depth_buffer(screen:ScreenBuffer):
+    """
+    Per cell view space depth of the closest face drawn so far, used instead of sorting the faces.
+    The array is kept in the screen buffer and reset in place
+    """
+    if screen.depth_buffer is None:
+        screen.depth_buffer = np.empty(screen.data.shape)
+    screen.depth_buffer.fill(np.inf)
+    return screen.depth_buffer
+
+
+def _plane_gradients(v1:ScreenPoint, v2:ScreenPoint, v3:ScreenPoint, a1:float, a2:float, a3:float, area:float):
+    """
+    Attribute values a1, a2, a3 at the triangle vertices define a plane over the screen: a(x, y) = origin + da_dx*x + da_dy*y
+    """
+    da_dx = ((a2 - a1) * (v3.y - v1.y) - (a3 - a1) * (v2.y - v1.y)) / area
+    da_dy = ((a3 - a1) * (v2.x - v1.x) - (a2 - a1) * (v3.x - v1.x)) / area
+    return a1 - da_dx * v1.x - da_dy * v1.y, da_dx, da_dy
+
+
+def get_ascii_codes(ascii_list) -> np.ndarray:
+    """
+    ASCII codes of the ramp as a numpy array, to pick the characters of a whole span at once
+    """
+    global _ascii_codes
+    if _ascii_codes[0] is not ascii_list:
+        _ascii_codes = (ascii_list, np.frombuffer("".join(ascii_list).encode('ascii'), dtype=np.uint8))
+    return _ascii_codes[1]
+
+_ascii_codes = (None, None)
+
+
+def fill_polygon(screen:ScreenBuffer, vertices:list[ScreenPoint], ascii_char, depth_buffer=None, light_values:list[float]=None, ascii_list=None, rows:tuple[int, int]=None):
+    """
+    Rasterizes a face (triangle or quad, in screen coords) as a triangle fan of scanline spans.
+    Every span is written to the screen as one row slice.
+    If a depth buffer is given, the vertices z must hold the view space depth. 1/z is linear in screen space, so it
+    is interpolated along each span and only the cells closer than what is already in the buffer are written.
+    If light values (one per vertex) are given, they are interpolated along the spans (Gouraud shading) and each
+    cell gets its own character from ascii_list instead of ascii_char.
+    rows (first, end) only writes the rows of that band
+    """
+    h, w = (screen.height, screen.width)
+    char_code = ord(ascii_char)
+    if light_values is not None:
+        ascii_codes = get_ascii_codes(ascii_list)
+        max_char_idx = len(ascii_codes) - 1
+
+    for i in range(1, len(vertices) - 1):
+        v1, v2, v3 = vertices[0], vertices[i], vertices[i + 1]
+        area = (v2.x - v1.x) * (v3.y - v1.y) - (v2.y - v1.y) * (v3.x - v1.x)
+        if depth_buffer is not None:
+            if v1.z <= 0 or v2.z <= 0 or v3.z <= 0:
+                continue # Behind the camera, there is no meaningful depth to interpolate
+            if area == 0:
+                continue
+            w_origin, dw_dx, dw_dy = _plane_gradients(v1, v2, v3, 1 / v1.z, 1 / v2.z, 1 / v3.z, area)
+        if light_values is not None and area != 0:
+            light_origin, dlight_dx, dlight_dy = _plane_gradients(v1, v2, v3, light_values[0], light_values[i], light_values[i + 1], area)
+
+        if depth_buffer is not None:
+            _fill_triangle_with_depth(
+                screen, triangle_spans(v1, v2, v3, h, w, rows), depth_buffer, (w_origin, dw_dx, dw_dy),
+                char_code if light_values is None else None,
+                (light_origin, dlight_dx, dlight_dy, ascii_codes, max_char_idx) if light_values is not None else None
+            )
+            continue
+
+        for y, start_x, end_x in triangle_spans(v1, v2, v3, h, w, rows):
+            span_chars = char_code
+            if light_values is not None:
+                span_light = light_origin + dlight_dy * y + dlight_dx * np.arange(start_x, end_x)
+                char_idx = np.clip((span_light * max_char_idx).astype(int), 0, max_char_idx)
+                span_chars = ascii_codes[char_idx]
+            screen[y][start_x:end_x] = span_chars
+
+
+def _fill_triangle_with_depth(screen:ScreenBuffer, spans, depth_buffer, depth_plane, char_code, light_plane):
+    """
+    Depth tested fill of the spans of one triangle. Small triangles are filled cell by cell, the cells of larger ones
+    are gathered into flat arrays so the depth interpolation, the test and the writes are done once per triangle
+    instead of once per span.
+    Spans of a single triangle never overlap, so the visible cells can be scattered with one fancy index assignment
+    """
+    spans = list(spans)
+    if not spans:
+        return
+    w_origin, dw_dx, dw_dy = depth_plane
+    if sum(end_x - start_x for _, start_x, end_x in spans) <= SCALAR_FILL_CELLS:
+        # Most faces cover a handful of cells, a plain loop is cheaper than the numpy calls setup
+        if light_plane is not None:
+            light_origin, dlight_dx, dlight_dy, ascii_codes, max_char_idx = light_plane
+        for y, start_x, end_x in spans:
+            depth_row = depth_buffer[y]
+            screen_row = screen.data[y]
+            for x in range(start_x, end_x):
+                depth = 1 / (w_origin + dw_dy * y + dw_dx * x)
+                if depth >= depth_row[x]:
+                    continue
+                depth_row[x] = depth
+                if light_plane is None:
+                    screen_row[x] = char_code
+                else:
+                    char_idx = int((light_origin + dlight_dy * y + dlight_dx * x) * max_char_idx)
+                    screen_row[x] = ascii_codes[min(max(char_idx, 0), max_char_idx)]
+        return
+
+    span_ys, span_starts, span_ends = np.array(spans).T
+    lengths = span_ends - span_starts
+    ys = np.repeat(span_ys, lengths)
+    xs = np.arange(len(ys)) + np.repeat(span_starts - (np.cumsum(lengths) - lengths), lengths)
+
+    cell_depth = 1 / (w_origin + dw_dy * ys + dw_dx * xs)
+    visible = cell_depth < depth_buffer[ys, xs]
+    if not visible.all():
+        if not visible.any():
+            return # Occluded
+        ys, xs, cell_depth = ys[visible], xs[visible], cell_depth[visible]
+    depth_buffer[ys, xs] = cell_depth
+
+    if light_plane is not None:
+        light_origin, dlight_dx, dlight_dy, ascii_codes, max_char_idx = light_plane
+        char_idx = np.clip(((light_origin + dlight_dy * ys + dlight_dx * xs) * max_char_idx).astype(int), 0, max_char_idx)
+        char_code = ascii_codes[char_idx]
+    screen.data[ys, xs] = char_code
+
+
+def draw_face_on_screen(face: Face, cam:Camera, screen:ScreenBuffer, ascii_list, depth_buffer=None):
+    h, w = (screen.height, screen.width)
 
-    affected_coords = []
     char_idx = int(face.light_value * (len(ascii_list) - 1))
     if char_idx >= len(ascii_list):
         char_idx = -1
     ascii_char = ascii_list[char_idx]
 
+    projections = [cam.project_vertex(vertex, return_relative_coords=True) for vertex in face.vertices]
+    if config.ENABLE_FRUSTUM_CULLING:
+        if any(projection.z <= cam.near_plane for projection in projections):
+            return # Behind the camera
+        for axis in ('x', 'y'):
+            coords = [getattr(projection, axis) for projection in projections]
+            if all(c < -1 for c in coords) or all(c >= 1 for c in coords):
+                return # Completely off screen
+
     vertices_screen_virtual_coords = []
-    for vertex in face.vertices:
-        projection = cam.project_vertex(vertex, return_relative_coords=True)
+    for projection in projections:
         translated_range = Vertex()
         # projection returns a range from -1 to 1, so we need to translate it to 0 - 1
         translated_range.x = (projection.x + 1) / 2
         translated_range.y = (projection.y + 1) / 2
         
-        screen_x = int(translated_range.x * w)
-        screen_y = int(translated_range.y * h)
+        screen_x = math.floor(translated_range.x * w)
+        screen_y = math.floor(translated_range.y * h)
         vertices_screen_virtual_coords.append(
-            Vertex(x=screen_x, y=screen_y)
+            ScreenPoint(screen_x, screen_y, projection.z)
         )
         if screen_y >= h or screen_x >= w or screen_y < 0 or screen_x < 0:
             continue
-        screen[screen_y][screen_x] = ascii_char
-        if config.ENABLE_DIRTY_RECTANGLES:
-            affected_coords.append((screen_x, screen_y))
+        if depth_buffer is not None:
+            if projection.z <= 0 or projection.z >= depth_buffer[screen_y, screen_x]:
+                continue
+            depth_buffer[screen_y, screen_x] = projection.z
+        screen[screen_y][screen_x] = ord(ascii_char)
     
+    first = vertices_screen_virtual_coords[0]
+    if all(vertex.x == first.x and vertex.y == first.y for vertex in vertices_screen_virtual_coords):
+        return # Smaller than a cell, the vertex dot is all there is to draw
+
+    light_values = None
+    if config.ENABLE_GOURAUD_SHADING and face.mesh is not None:
+        light_values = [vertex.light_value for vertex in face.vertices]
+
+    if config.ENABLE_VECTORIZED_RASTERIZER or depth_buffer is not None or light_values is not None:
+        fill_polygon(screen, vertices_screen_virtual_coords, ascii_char, depth_buffer, light_values, ascii_list)
+        return
+
     triangles = []
     if len(vertices_screen_virtual_coords) == 3:
         triangles.append(vertices_screen_virtual_coords)
@@ -139,31 +461,228 @@ def draw_face_on_screen(face: Face, cam:Camera, screen, ascii_list):
                     is_inside_face = True
                     break
             if is_inside_face:
-                screen[y][x] = ascii_char
-                if config.ENABLE_DIRTY_RECTANGLES:
-                    affected_coords.append((x, y))
+                screen[y][x] = ord(ascii_char)
+
+def screen_cells(projection:np.ndarray, h:int, w:int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Screen cell (x, y arrays) of points projected with Camera.project_many
+    """
+    # projection returns a range from -1 to 1, so we need to translate it to 0 - 1
+    # Floored, truncating would snap the points just past the left and top edges onto column and row 0
+    screen_x = np.floor((projection[:, 0] + 1) / 2 * w).astype(int)
+    screen_y = np.floor((projection[:, 1] + 1) / 2 * h).astype(int)
+    return screen_x, screen_y
+
+
+def find_sub_cell_faces(screen_x:np.ndarray, screen_y:np.ndarray, face_vertex_indices:np.ndarray) -> np.ndarray:
+    """
+    Mask of the faces that have all their vertices in the same screen cell (projected area below one cell)
+    """
+    # Padded slots repeat the first vertex
+    slots = np.where(face_vertex_indices >= 0, face_vertex_indices, face_vertex_indices[:, :1])
+    face_x = screen_x[slots]
+    face_y = screen_y[slots]
+    return ((face_x == face_x[:, :1]) & (face_y == face_y[:, :1])).all(axis=1)
+
+
+def project_mesh_faces(mesh:Mesh, face_indices:np.ndarray, cam:Camera, h:int, w:int, ascii_list):
+    """
+    Projects every vertex of the mesh once to screen cells. Returns the points, the vertex indices of the faces
+    (padded with -1 like Mesh.index_buffer), the ASCII code of each face and the mask of the faces smaller than a
+    cell (see find_sub_cell_faces), in the given face order.
+    With config.ENABLE_FRUSTUM_CULLING, faces that are off screen or behind the camera are left out
+    """
+    projection = cam.project_many(mesh.vertex_buffer)
+    if config.ENABLE_FRUSTUM_CULLING:
+        face_indices = cam.cull_faces_outside_frustum(projection, mesh.index_buffer, face_indices)
+    screen_x, screen_y = screen_cells(projection, h, w)
+    points = list(map(ScreenPoint, screen_x.tolist(), screen_y.tolist(), projection[:, 2].tolist()))
+    face_vertex_indices = mesh.index_buffer[face_indices]
+
+    ascii_codes = get_ascii_codes(ascii_list)
+    max_char_idx = len(ascii_codes) - 1
+    face_chars = ascii_codes[np.clip((mesh.light_values[face_indices] * max_char_idx).astype(int), 0, max_char_idx)]
+    return points, face_vertex_indices, face_chars, find_sub_cell_faces(screen_x, screen_y, face_vertex_indices)
+
+
+def rasterize_faces(screen:ScreenBuffer, points:list[ScreenPoint], face_vertex_indices:np.ndarray, face_chars:np.ndarray, ascii_list, depth_buffer=None, vertex_light_values:list[float]=None, rows:tuple[int, int]=None, sub_cell_faces:np.ndarray=None):
+    """
+    Draws faces given as indices into the projected points (see project_mesh_faces), in order.
+    rows (first, end) only writes the rows of that band.
+    The faces in sub_cell_faces only cover the cell of their vertices, they are splatted as a single character
+    (only if closer than what is in the depth buffer) without going through the polygon fill.
+    Returns the number of sub-cell faces actually written
+    """
+    h, w = (screen.height, screen.width)
+    first_row, end_row = rows if rows is not None else (0, h)
+    if sub_cell_faces is None:
+        sub_cell_faces = np.zeros(len(face_vertex_indices), dtype=bool)
+    splatted_faces = 0
+
+    for vertex_indices, char_code, sub_cell in zip(face_vertex_indices.tolist(), face_chars.tolist(), sub_cell_faces.tolist()):
+        if sub_cell:
+            vertex = points[vertex_indices[0]]
+            if vertex.y >= end_row or vertex.x >= w or vertex.y < first_row or vertex.x < 0:
+                continue
+            if depth_buffer is not None:
+                # Same as drawing the vertex dots one after the other: the closest one in front of the camera
+                depth = min((points[idx].z for idx in vertex_indices if idx >= 0 and points[idx].z > 0), default=np.inf)
+                if depth >= depth_buffer[vertex.y, vertex.x]:
+                    continue # Already covered by a closer face
+                depth_buffer[vertex.y, vertex.x] = depth
+            screen[vertex.y][vertex.x] = char_code
+            splatted_faces += 1
+            continue
+
+        if vertex_indices[-1] < 0:
+            vertex_indices = [idx for idx in vertex_indices if idx >= 0]
+        vertices = [points[idx] for idx in vertex_indices]
 
-    return affected_coords
+        for vertex in vertices:
+            if vertex.y >= end_row or vertex.x >= w or vertex.y < first_row or vertex.x < 0:
+                continue
+            if depth_buffer is not None:
+                if vertex.z <= 0 or vertex.z >= depth_buffer[vertex.y, vertex.x]:
+                    continue
+                depth_buffer[vertex.y, vertex.x] = vertex.z
+            screen[vertex.y][vertex.x] = char_code
 
-def draw_fps(real_fps, screen):
+        light_values = None
+        if vertex_light_values is not None:
+            light_values = [vertex_light_values[idx] for idx in vertex_indices]
+        fill_polygon(screen, vertices, chr(char_code), depth_buffer, light_values, ascii_list, rows)
+    return splatted_faces
+
+
+def draw_mesh_on_screen(mesh:Mesh, face_indices:np.ndarray, cam:Camera, screen:ScreenBuffer, ascii_list, depth_buffer=None):
+    """
+    Draws the faces of the mesh in the given order. Same result as calling draw_face_on_screen for each face, but
+    every vertex is projected once and the faces index into the projected vertices.
+    With config.ENABLE_FRUSTUM_CULLING, faces that are off screen or behind the camera are skipped
+    """
+    points, face_vertex_indices, face_chars, sub_cell_faces = project_mesh_faces(mesh, face_indices, cam, screen.height, screen.width, ascii_list)
+    vertex_light_values = mesh.vertex_light_values.tolist() if config.ENABLE_GOURAUD_SHADING else None
+    rasterize_faces(screen, points, face_vertex_indices, face_chars, ascii_list, depth_buffer, vertex_light_values, sub_cell_faces=sub_cell_faces)
+
+
+def render_mesh(mesh:Mesh, cam:Camera, screen:ScreenBuffer, ascii_list, renderer=None):
+    """
+    Draws the mesh into the screen buffer with the settings in config: whole mesh and face culling, depth buffer
+    or sorted faces, and the rasterizer. renderer (tiled_drawing.TiledRenderer) rasterizes in worker processes
+    """
+    depth_buffer = None
+    if config.ENABLE_DEPTH_BUFFER:
+        depth_buffer = get_depth_buffer(screen)
+    if config.ENABLE_FRUSTUM_CULLING and not cam.is_sphere_visible(mesh.center, mesh.bounding_radius):
+        face_indices = np.empty(0, dtype=int) # The whole mesh is off screen
+    else:
+        face_indices = mesh.depth_sort_face_indices(cam, sort=depth_buffer is None)
+    if renderer is not None:
+        renderer.draw_mesh_on_screen(mesh, face_indices, cam, screen, ascii_list, depth_buffer)
+    elif config.ENABLE_VECTORIZED_RASTERIZER or depth_buffer is not None:
+        draw_mesh_on_screen(mesh, face_indices, cam, screen, ascii_list, depth_buffer)
+    else:
+        for face_idx in face_indices:
+            draw_face_on_screen(mesh.faces[face_idx], cam, screen, ascii_list, depth_buffer)
+
+
+def draw_fps(real_fps, screen:ScreenBuffer):
     text = "FPS: {value}".format(value="{:.2f}".format(real_fps))
     size = len(text)
-    for idx, char in enumerate(text):
-        screen[len(screen)-10][len(screen[-1])-size+idx-10] = char
-
-
-def draw_screen(screen_data):
-    h, w = (len(screen_data), len(screen_data[0]))
-    # sys.stdout.write("\033[2J")  # Clear the terminal screen
-    sys.stdout.write("\033[0;0H")  # Move cursor to top-left
-    for y in range(h):
-        for x in range(w):
-            if screen_data[y][x] is not None:
-                sys.stdout.write(screen_data[y][x])
-            else:
-                sys.stdout.write(' ')
+    if screen.width < size + 10 or screen.height < 10:
+        return # The counter doesn't fit
+    screen[screen.height-10][screen.width-size-10:screen.width-10] = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+
+
+DIFF_MAX_GAP = 8 # Size of a cursor positioning escape sequence
+
+
+def frame_output(screen_data:np.ndarray, last_frame:np.ndarray=None) -> str:
+    """
+    Builds the whole frame as a single string.
+    When the last frame drawn is given (with the same size), only the runs of cells that changed are written,
+    each one preceded by an ANSI cursor positioning escape
+    """
+    if last_frame is None or last_frame.shape != screen_data.shape:
+        # sys.stdout.write("\033[2J")  # Clear the terminal screen
+        output = ["\033[0;0H", screen_data.tobytes().decode('ascii')]  # Move cursor to top-left
+    else:
+        output = []
+        changed = screen_data != last_frame
+        for y in np.flatnonzero(changed.any(axis=1)).tolist():
+            changed_columns = np.flatnonzero(changed[y])
+            # Rewriting a few unchanged cells is cheaper than emitting another escape sequence
+            breaks = np.flatnonzero(np.diff(changed_columns) > DIFF_MAX_GAP)
+            run_starts = changed_columns[np.r_[0, breaks + 1]].tolist()
+            run_ends = (changed_columns[np.r_[breaks, len(changed_columns) - 1]] + 1).tolist()
+            row = screen_data[y]
+            for run_start, run_end in zip(run_starts, run_ends):
+                output.append(f"\033[{y + 1};{run_start + 1}H")
+                output.append(row[run_start:run_end].tobytes().decode('ascii'))
+    return "".join(output)
+
+
+def draw_screen(screen:ScreenBuffer, last_frame:np.ndarray=None):
+    """
+    Writes the frame (see frame_output) with one call
+    """
+    sys.stdout.write(frame_output(screen.data, last_frame))
     sys.stdout.flush()
 
+
+class FrameWriter:
+    """
+    Writes the frames to the terminal from a separate thread, so the next frame is computed while the previous one
+    is written (the write releases the GIL while it blocks on a slow terminal).
+    Submitted frames wait in a bounded queue; when the output falls behind, the oldest frame is dropped. The diff is
+    made against the last frame actually written, so dropping frames never leaves stale cells on the terminal
+    """
+
+    def __init__(self, max_pending:int=2, diff:bool=True) -> None:
+        self.diff = diff
+        self.dropped_frames = 0
+        self._pending = deque(maxlen=max_pending)
+        self._condition = threading.Condition()
+        self._running = True
+        self._last_frame:np.ndarray = None
+        self._thread = threading.Thread(target=self._run, name="frame-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, screen:ScreenBuffer):
+        """
+        Queues a copy of the screen, the screen buffer can be cleared and reused right away
+        """
+        frame = screen.data.copy()
+        with self._condition:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped_frames += 1
+            self._pending.append(frame) # deque(maxlen) drops the oldest
+            self._condition.notify()
+
+    def close(self, flush:bool=False):
+        """
+        Stops the writer thread, writing the frames still queued first if flush is set
+        """
+        with self._condition:
+            if not flush:
+                self._pending.clear()
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                frame = self._pending.popleft()
+            sys.stdout.write(frame_output(frame, self._last_frame if self.diff else None))
+            sys.stdout.flush()
+            self._last_frame = frame
+
+
 def hide_cursor():
     sys.stdout.write("\033[?25l")
     sys.stdout.flush()
@@ -0,0 +1,134 @@
+import multiprocessing
+import signal
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import config
+import terminal_drawing
+from terminal_drawing import ScreenBuffer, ScreenPoint
+from lib_3d.utils_3d import Camera, Mesh
+
+BANDS_PER_WORKER = 2 # More bands than workers, so a band full of faces doesn't leave the other workers idle
+
+
+class TiledRenderer:
+    """
+    Rasterizes a mesh with a pool of worker processes. The screen is split into row bands, the projected faces are
+    binned into the bands they overlap (keeping the draw order) and every band is rasterized by a worker.
+    The workers write into a screen (and depth) buffer in shared memory, bands don't overlap so no locking is needed.
+    The projection, culling and lighting stay in the main process
+    """
+
+    def __init__(self, workers:int) -> None:
+        self.workers = workers
+        self.pool = multiprocessing.Pool(workers, initializer=_init_worker)
+        self._screen_memory:shared_memory.SharedMemory = None
+        self._depth_memory:shared_memory.SharedMemory = None
+        self._shared_screen:np.ndarray = None
+        self._shared_depth:np.ndarray = None
+
+    def _allocate(self, shape:tuple[int, int]):
+        """
+        (Re)allocates the shared buffers when the screen size changes
+        """
+        if self._shared_screen is not None and self._shared_screen.shape == shape:
+            return
+        self._release()
+        lines, columns = shape
+        self._screen_memory = shared_memory.SharedMemory(create=True, size=lines * columns)
+        self._depth_memory = shared_memory.SharedMemory(create=True, size=lines * columns * np.dtype(float).itemsize)
+        self._shared_screen = np.ndarray(shape, dtype=np.uint8, buffer=self._screen_memory.buf)
+        self._shared_depth = np.ndarray(shape, dtype=float, buffer=self._depth_memory.buf)
+
+    def _release(self):
+        self._shared_screen = None
+        self._shared_depth = None
+        for memory in (self._screen_memory, self._depth_memory):
+            if memory is not None:
+                memory.close()
+                memory.unlink()
+        self._screen_memory = None
+        self._depth_memory = None
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        self._release()
+
+    def rasterize_bands(self, tasks:list[tuple]):
+        """
+        Runs the band tasks of draw_mesh_on_screen in the workers, returns when all of them are done
+        """
+        self.pool.map(_rasterize_band, tasks, chunksize=1)
+
+    def draw_mesh_on_screen(self, mesh:Mesh, face_indices:np.ndarray, cam:Camera, screen:ScreenBuffer, ascii_list, depth_buffer=None):
+        """
+        Same result as terminal_drawing.draw_mesh_on_screen
+        """
+        h, w = (screen.height, screen.width)
+        points, face_vertex_indices, face_chars, sub_cell_faces = terminal_drawing.project_mesh_faces(mesh, face_indices, cam, h, w, ascii_list)
+        vertex_light_values = mesh.vertex_light_values.tolist() if config.ENABLE_GOURAUD_SHADING else None
+
+        self._allocate((h, w))
+        self._shared_screen[:] = screen.data
+        if depth_buffer is not None:
+            self._shared_depth[:] = depth_buffer
+
+        # Sent to the workers as arrays, cheaper to pickle than the list of ScreenPoint
+        point_buffer = np.array(points, dtype=float).reshape(-1, 3)
+
+        # Rows covered by each face, padded vertices are ignored
+        face_ys = point_buffer[:, 1].astype(int)[face_vertex_indices]
+        valid_slots = face_vertex_indices >= 0
+        face_min_y = np.where(valid_slots, face_ys, h).min(axis=1)
+        face_max_y = np.where(valid_slots, face_ys, -1).max(axis=1)
+
+        band_count = min(self.workers * BANDS_PER_WORKER, h)
+        band_edges = np.linspace(0, h, band_count + 1).astype(int)
+        tasks = []
+        for first_row, end_row in zip(band_edges[:-1].tolist(), band_edges[1:].tolist()):
+            in_band = (face_min_y < end_row) & (face_max_y >= first_row)
+            if not in_band.any():
+                continue
+            tasks.append((
+                self._screen_memory.name, self._depth_memory.name, (h, w), (first_row, end_row),
+                point_buffer, face_vertex_indices[in_band], face_chars[in_band], sub_cell_faces[in_band], ascii_list,
+                depth_buffer is not None, vertex_light_values
+            ))
+        self.rasterize_bands(tasks)
+
+        screen.data[:] = self._shared_screen
+        if depth_buffer is not None:
+            depth_buffer[:] = self._shared_depth
+
+
+def _init_worker():
+    """
+    Forked workers inherit the signal handlers of the main process, Ctrl-C and terminal resizes are handled there only
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, 'SIGWINCH'): # Not available on Windows
+        signal.signal(signal.SIGWINCH, signal.SIG_DFL)
+
+
+# Shared memory blocks attached by this worker process, by name
+_attached_memory = {}
+
+def _attach(name:str, shape:tuple[int, int], dtype) -> np.ndarray:
+    memory = _attached_memory.get(name)
+    if memory is None:
+        memory = shared_memory.SharedMemory(name=name)
+        # Attaching registers the block to be removed when this process exits, but it belongs to the main process
+        resource_tracker.unregister(memory._name, 'shared_memory')
+        _attached_memory[name] = memory
+    return np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def _rasterize_band(task):
+    screen_name, depth_name, shape, rows, point_buffer, face_vertex_indices, face_chars, sub_cell_faces, ascii_list, use_depth, vertex_light_values = task
+    for name in list(_attached_memory):
+        if name not in (screen_name, depth_name): # Buffers of a screen size that is no longer used
+            _attached_memory.pop(name).close()
+    screen = ScreenBuffer(data=_attach(screen_name, shape, np.uint8))
+    depth_buffer = _attach(depth_name, shape, float) if use_depth else None
+    points = list(map(ScreenPoint, point_buffer[:, 0].astype(int).tolist(), point_buffer[:, 1].astype(int).tolist(), point_buffer[:, 2].tolist()))
+    terminal_drawing.rasterize_faces(screen, points, face_vertex_indices, face_chars, ascii_list, depth_buffer, vertex_light_values, rows, sub_cell_faces)